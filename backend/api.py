@@ -1,19 +1,31 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Response, UploadFile, File, Security, Depends, Form
+from fastapi import FastAPI, APIRouter, HTTPException, Request, Response, UploadFile, File, Security, Depends, Form
 from fastapi.security import APIKeyHeader
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 from io import BytesIO
-import pandas as pd
-import base64
+import asyncio
 import logging
 import json
-from datetime import datetime
+from datetime import date, datetime
+from .lazy_imports import pd, start_warmup, readiness
+from .chart_store import chart_store
+from .validation import validate_export
+from .outbox import outbox, outbox_sender, start_outbox_sender
+from .metrics_store import get_metrics_store
+from .smtp_concurrency import smtp_controller
+from .recipients import get_recipient_resolver
+from .eml_archive import iter_eml_archive
+from .batch import get_batch_pool, prepare_export
+from .profiling import PROFILING_ENABLED, ProfilingMiddleware, list_profiles, profile_artifact_path
 from .ge_automatic_email_tracking import (
     process_supervisors,
     generate_chart,
-    get_course_unit_2_indices,
+    compute_chart_data,
+    collect_supervisor_metrics,
+    render_supervisor_emails,
+    CHART_CATEGORIES,
     safe_convert_to_float,
     create_email_content,
     send_test_email  # Add this to ge_automatic_email_tracking.py
@@ -39,6 +51,10 @@ app.add_middleware(
     allow_headers=["*"]
 )
 
+# Opt-in request profiling (PROFILING_ENABLED / PROFILING_SAMPLE_RATE / X-Profile header)
+if PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware, api_key=lambda: API_KEY)
+
 @app.get("/test")
 async def test_route():
     return {"message": "Test route is working"}
@@ -48,6 +64,14 @@ async def list_routes():
     for route in app.routes:
         print(route.path, route.methods)
 
+@app.on_event("startup")
+async def warm_up_heavy_imports():
+    start_warmup()
+
+@app.on_event("startup")
+async def start_outbox():
+    start_outbox_sender()
+
 class EmailTemplate(BaseModel):
     subject: str
     greeting: str
@@ -58,11 +82,18 @@ class EmailTemplate(BaseModel):
 
 class PreviewResponse(BaseModel):
     success: bool
-    chart: str  # Base64 encoded chart image
+    chartUrl: Optional[str] = None  # Content-addressed URL of the chart PNG, relative to the API host; None if not rendered
     content: str  # HTML email content
     metrics: Dict[str, float]
     sendTestEmail: Optional[bool] = False
 
+class ChartDataResponse(BaseModel):
+    success: bool
+    supervisors: List[str]  # In plotting order (top to bottom)
+    series: Dict[str, List[float]]  # Completed / Pending / Past Due values aligned with supervisors
+    max_total: float
+    x_limits: List[float]  # [min, max] of the value axis, as used by the email chart
+
 class ProcessResponse(BaseModel):
     success: bool
     message: str
@@ -72,9 +103,16 @@ class ProcessResponse(BaseModel):
     email_success: Optional[int]
     email_failure: Optional[int]
 
+class BatchProcessResponse(BaseModel):
+    success: bool  # True only if every file was processed
+    message: str
+    timestamp: str
+    results: List[ProcessResponse]  # One entry per uploaded file, in upload order
+
 class ErrorDetail(BaseModel):
     detail: str
 
+API_KEY: Optional[str] = None  # Set by initialise_api
 API_KEY_NAME = "X-API-Key"
 api_key_header = APIKeyHeader(name=API_KEY_NAME)
 
@@ -92,34 +130,31 @@ def initialise_api(api_key: str):
 
 @router.options("/upload-csv", include_in_schema=False)
 @router.options("/preview-email", include_in_schema=False)
+@router.options("/chart-data", include_in_schema=False)
 @router.options("/process-emails", include_in_schema=False)
+@router.options("/export-emails", include_in_schema=False)
+@router.options("/process-emails/batch", include_in_schema=False)
 @router.options("/send-test-email", include_in_schema=False)
 async def options_handler(response: Response):
     response.headers.update({
         "Access-Control-Allow-Origin": "*",
         "Access-Control-Allow-Methods": "GET, POST, PUT, DELETE, OPTIONS",
-        "Access-Control-Allow-Headers": "Content-Type, X-API-Key",
+        "Access-Control-Allow-Headers": "Content-Type, X-API-Key, X-Profile",
         "Access-Control-Max-Age": "86400",
     })
     return {}
 
-def validate_csv(df: pd.DataFrame) -> bool:
-    try:        
-        if len(df) < 1:
-            raise ValueError("CSV file is empty")
-            
-        # Check if we can find the Course Units section
-        start_idx, end_idx = get_course_unit_2_indices(df)
-        if start_idx is None or end_idx is None:
-            raise ValueError("Could not find Course Units section in CSV")
-            
+def validate_csv(df: 'pd.DataFrame') -> bool:
+    try:
+        # Checks the whole file up front and reports every bad row at once
+        validate_export(df)
         return True
         
     except Exception as e:
         logger.error(f"CSV validation failed: {str(e)}")
         raise ValueError(f"CSV validation failed: {str(e)}")
 
-def get_row_metrics(data: pd.DataFrame, row_index: int) -> Dict[str, float]:
+def get_row_metrics(data: 'pd.DataFrame', row_index: int) -> Dict[str, float]:
     try:
         row = data.iloc[row_index]
         metrics = {
@@ -176,6 +211,7 @@ async def preview_email(
     response: Response,
     file: UploadFile = File(...),
     row_index: str = Form('0'),
+    render_chart: bool = Form(True),  # False when the client draws the chart from /api/chart-data
 ) -> PreviewResponse:
     try:
         row_index = int(row_index)
@@ -186,8 +222,9 @@ async def preview_email(
             raise ValueError("Invalid CSV structure")
         
         metrics = get_row_metrics(df, row_index)
-        chart_bytes = generate_chart(df)
-        chart_base64 = base64.b64encode(chart_bytes).decode()
+        chart_url = None
+        if render_chart:
+            chart_url = f"/api/charts/{chart_store.put(generate_chart(df))}.png"
         
         # Generate email content with template
         # template_dict = template.model_dump() if template else None
@@ -195,7 +232,7 @@ async def preview_email(
         
         return PreviewResponse(
             success=True,
-            chart=chart_base64,
+            chartUrl=chart_url,
             content=email_content,
             metrics=metrics,
             sendTestEmail=False # Default value
@@ -205,11 +242,105 @@ async def preview_email(
         logger.error(f"Error generating preview: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
 
+@router.post("/chart-data")
+async def chart_data(
+    response: Response,
+    file: UploadFile = File(...),
+) -> ChartDataResponse:
+    """Return the chart series so the browser can draw the preview without server-side rendering."""
+    try:
+        content = await file.read()
+        df = pd.read_csv(BytesIO(content))
+
+        if not validate_csv(df):
+            raise ValueError("Invalid CSV structure")
+
+        data, sorted_supervisors, max_total = compute_chart_data(df)
+
+        return ChartDataResponse(
+            success=True,
+            supervisors=sorted_supervisors,
+            series={
+                category: [data[sup][category] for sup in sorted_supervisors]
+                for category in CHART_CATEGORIES
+            },
+            max_total=max_total,
+            x_limits=[0, max_total * 1.2]
+        )
+
+    except Exception as e:
+        logger.error(f"Error computing chart data: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+CHART_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+@router.get("/charts/{digest}.png")
+async def get_chart(digest: str, request: Request):
+    """Serve a rendered chart by content digest, honouring If-None-Match."""
+    chart = chart_store.get(digest)
+    if chart is None:
+        raise HTTPException(status_code=404, detail="Chart not found or expired")
+
+    etag = f'"{digest}"'
+    headers = {"ETag": etag, "Cache-Control": CHART_CACHE_CONTROL}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        if "*" in candidates or etag in candidates:
+            return Response(status_code=304, headers=headers)
+
+    return Response(content=chart, media_type="image/png", headers=headers)
+
+def build_template_dict(template_data: Dict[str, str]) -> Dict[str, str]:
+    """Fill missing template parts with the defaults used by the frontend."""
+    return {
+        "subject": template_data.get('subject', "Training Tasks Update"),
+        "greeting": template_data.get('greeting', "Dear Team Leader,"),
+        "intro": template_data.get('intro', "This is a reminder about pending training tasks in your team:"),
+        "action": template_data.get('action', "Please ensure your team completes any pending or past due tasks by this Friday.\nBelow is the chart to show the current status of your team and others:"),
+        "closing": template_data.get('closing', "Best regards,\nHR Team")
+    }
+
+def parse_snapshot_date(snapshot_date: Optional[str]) -> Optional[date]:
+    """Validate the snapshot_date form field before anything is sent; None means today."""
+    if not snapshot_date:
+        return None
+    try:
+        return date.fromisoformat(snapshot_date)
+    except ValueError:
+        raise ValueError(f"Invalid snapshot_date '{snapshot_date}', expected YYYY-MM-DD")
+
+def record_metrics_history(
+    df: 'pd.DataFrame',
+    filename: Optional[str],
+    taken_on: Optional[date] = None,
+    trend_weeks: int = 0
+) -> Optional[bytes]:
+    """
+    Append this export's per-supervisor metrics to the history store.
+
+    Returns a chart with trend lines when trend_weeks > 0, otherwise None so the
+    default chart is rendered. History problems are logged and never block sending.
+    """
+    store = get_metrics_store()
+    if store is None:
+        return None
+    try:
+        metrics, emails, _ = collect_supervisor_metrics(df)
+        store.record_snapshot(metrics, emails, taken_on, source=filename or '')
+        if trend_weeks > 0:
+            return generate_chart(df, history=store.trends(metrics.keys(), weeks=trend_weeks, until=taken_on))
+    except Exception as e:
+        logger.error(f"Error recording metrics history: {str(e)}")
+    return None
+
 @router.post("/process-emails")
 async def process_emails(
     response: Response,
     file: UploadFile = File(...),
     template: str = Form(None),
+    snapshot_date: str = Form(None),  # ISO date the export was taken, defaults to today
+    trend_weeks: int = Form(0),  # Draw past due trend lines over this many weeks of history
 ) -> ProcessResponse:
     try:
         # Read CSV content
@@ -221,23 +352,22 @@ async def process_emails(
         send_test_copy = template_data.get('sendTestCopy', False)
         logger.info(f"Received sendTestCopy flag: {send_test_copy}")
 
-        template_dict = {
-            "subject": template_data.get('subject', "Training Tasks Update"),
-            "greeting": template_data.get('greeting', "Dear Team Leader,"),
-            "intro": template_data.get('intro', "This is a reminder about pending training tasks in your team:"),
-            "action": template_data.get('action', "Please ensure your team completes any pending or past due tasks by this Friday.\nBelow is the chart to show the current status of your team and others:"),
-            "closing": template_data.get('closing', "Best regards,\nHR Team")
-        }
+        template_dict = build_template_dict(template_data)
+        taken_on = parse_snapshot_date(snapshot_date)
 
         # Validate CSV
         if not validate_csv(df):
             raise ValueError("Invalid CSV structure")
         
+        chart_bytes = record_metrics_history(df, file.filename, taken_on, trend_weeks)
+
         # Process emails
         success_count, failure_count = process_supervisors(
             df, 
             template_dict, 
-            send_test=send_test_copy
+            send_test=send_test_copy,
+            outbox=outbox,
+            chart=chart_bytes
         )
 
         # Only attempt test email if specifically requested
@@ -266,7 +396,10 @@ async def process_emails(
         
         return ProcessResponse(
             success=True,
-            message=f"Processed {success_count + failure_count} emails",
+            message=(
+                f"Queued {success_count} of {success_count + failure_count} emails for delivery"
+                if outbox is not None else f"Processed {success_count + failure_count} emails"
+            ),
             filename=file.filename,
             timestamp=timestamp,
             processed_rows=len(df)-2,
@@ -278,11 +411,249 @@ async def process_emails(
         logger.error(f"Error processing emails: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
 
+def failed_file_response(filename: str, message: str) -> ProcessResponse:
+    return ProcessResponse(
+        success=False,
+        message=message,
+        filename=filename,
+        timestamp=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        processed_rows=0,
+        email_success=None,
+        email_failure=None
+    )
+
+def dispatch_prepared_export(
+    prepared: Dict[str, object],
+    template_dict: Dict[str, str],
+    taken_on: Optional[date]
+) -> ProcessResponse:
+    """
+    Send one prepared batch file through the shared dispatch pipeline.
+
+    Runs on a worker thread, so it only records history; the chart (with any trend
+    lines) was already rendered in the batch worker process. Never raises: a file
+    that fails (e.g. recipient directory outage) is reported in its own response
+    while the other files carry on.
+    """
+    filename = prepared['filename']
+    if prepared['error']:
+        return failed_file_response(filename, f"CSV validation failed: {prepared['error']}")
+
+    df = prepared['data']
+    try:
+        record_metrics_history(df, filename, taken_on)
+        success_count, failure_count = process_supervisors(df, template_dict, outbox=outbox, chart=prepared['chart'])
+    except Exception as e:
+        logger.error(f"Error processing batch file {filename}: {str(e)}")
+        return failed_file_response(filename, f"Processing failed: {str(e)}")
+    return ProcessResponse(
+        success=True,
+        message=(
+            f"Queued {success_count} of {success_count + failure_count} emails for delivery"
+            if outbox is not None else f"Processed {success_count + failure_count} emails"
+        ),
+        filename=filename,
+        timestamp=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        processed_rows=len(df)-2,
+        email_success=success_count,
+        email_failure=failure_count
+    )
+
+@router.post("/process-emails/batch")
+async def process_emails_batch(
+    response: Response,
+    files: List[UploadFile] = File(...),
+    template: str = Form(None),
+    snapshot_date: str = Form(None),
+    trend_weeks: int = Form(0),
+) -> BatchProcessResponse:
+    """
+    Process several exports (one per business unit) in one call.
+
+    Files are parsed, validated and charted in parallel worker processes, then
+    sent concurrently; all sends share the adaptive SMTP limit and the outbox.
+    """
+    try:
+        template_dict = build_template_dict(json.loads(template) if template else {})
+        taken_on = parse_snapshot_date(snapshot_date)
+        uploads = [(upload.filename or f"file_{i}", await upload.read()) for i, upload in enumerate(files)]
+
+        loop = asyncio.get_running_loop()
+        pool = get_batch_pool()
+        prepared = await asyncio.gather(*(
+            loop.run_in_executor(pool, prepare_export, filename, content, trend_weeks, taken_on)
+            for filename, content in uploads
+        ))
+
+        results = await asyncio.gather(*(
+            asyncio.to_thread(dispatch_prepared_export, item, template_dict, taken_on)
+            for item in prepared
+        ))
+
+        failed_files = sum(1 for result in results if not result.success)
+        return BatchProcessResponse(
+            success=failed_files == 0,
+            message=(
+                f"Processed {len(results) - failed_files} of {len(results)} files, "
+                f"{sum(r.email_success or 0 for r in results)} emails succeeded and "
+                f"{sum(r.email_failure or 0 for r in results)} failed"
+            ),
+            timestamp=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            results=list(results)
+        )
+
+    except Exception as e:
+        logger.error(f"Error processing email batch: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/export-emails")
+async def export_emails(
+    response: Response,
+    file: UploadFile = File(...),
+    template: str = Form(None),
+):
+    """
+    Stream a ZIP with one fully rendered .eml per recipient, for auditing before a real send.
+
+    Messages come from the same rendering pipeline as process-emails and are
+    rendered one at a time while the archive streams, so memory use does not
+    grow with the number of recipients.
+    """
+    try:
+        content = await file.read()
+        df = pd.read_csv(BytesIO(content))
+
+        if not validate_csv(df):
+            raise ValueError("Invalid CSV structure")
+
+        template_dict = build_template_dict(json.loads(template) if template else {})
+        # Metrics and chart are computed up front so errors still surface as a 400
+        collected = collect_supervisor_metrics(df)
+        chart_bytes = generate_chart(df)
+        messages = render_supervisor_emails(df, template_dict, chart_bytes, collected)
+        archive_name = f"{(file.filename or 'export').rsplit('.', 1)[0]}_emails.zip"
+
+        return StreamingResponse(
+            iter_eml_archive(messages),
+            media_type="application/zip",
+            headers={"Content-Disposition": f'attachment; filename="{archive_name}"'}
+        )
+
+    except Exception as e:
+        logger.error(f"Error exporting emails: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.get("/health")
 async def health_check(response: Response, api_key: str = Depends(get_api_key)):
     """Health check endpoint."""
     return {"status": "healthy"}
 
+def get_history_store():
+    store = get_metrics_store()
+    if store is None:
+        raise HTTPException(status_code=404, detail="Metrics history is disabled (METRICS_HISTORY_ENABLED=false)")
+    return store
+
+@router.get("/metrics/supervisors")
+async def metrics_supervisors(api_key: str = Depends(get_api_key)):
+    """Supervisors with stored history and their latest snapshot date."""
+    return {"supervisors": get_history_store().list_supervisors()}
+
+@router.get("/metrics/trend")
+async def metrics_trend(
+    supervisor: Optional[str] = None,
+    email: Optional[str] = None,
+    weeks: int = 12,
+    api_key: str = Depends(get_api_key)
+):
+    """One supervisor's metrics per snapshot over the last `weeks` weeks (0 for all history)."""
+    try:
+        points = get_history_store().supervisor_trend(supervisor=supervisor, email=email, weeks=weeks)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"supervisor": supervisor, "email": email, "weeks": weeks, "points": points}
+
+@router.get("/metrics/totals")
+async def metrics_totals(weeks: int = 12, api_key: str = Depends(get_api_key)):
+    """Organisation-wide totals per snapshot over the last `weeks` weeks (0 for all history)."""
+    return {"weeks": weeks, "points": get_history_store().totals(weeks=weeks)}
+
+@router.get("/smtp/status")
+async def smtp_status(api_key: str = Depends(get_api_key)):
+    """Current adaptive SMTP concurrency limit, latency and effective send rate."""
+    return smtp_controller.status()
+
+@router.get("/recipients/status")
+async def recipients_status(api_key: str = Depends(get_api_key)):
+    """Recipient directory backend and cache statistics."""
+    return get_recipient_resolver().status()
+
+@router.post("/recipients/cache/clear")
+async def clear_recipients_cache(api_key: str = Depends(get_api_key)):
+    """Drop cached lookups, e.g. after fixing a directory entry."""
+    resolver = get_recipient_resolver()
+    resolver.clear()
+    return resolver.status()
+
+def get_outbox_sender():
+    if outbox_sender is None:
+        raise HTTPException(status_code=404, detail="Outbox spool is not enabled (set OUTBOX_DIR)")
+    return outbox_sender
+
+@router.get("/outbox")
+async def outbox_status(api_key: str = Depends(get_api_key)):
+    """Spool depth and sender state."""
+    return get_outbox_sender().status()
+
+@router.post("/outbox/pause")
+async def pause_outbox(api_key: str = Depends(get_api_key)):
+    sender = get_outbox_sender()
+    sender.pause()
+    return sender.status()
+
+@router.post("/outbox/resume")
+async def resume_outbox(api_key: str = Depends(get_api_key)):
+    sender = get_outbox_sender()
+    sender.resume()
+    sender.start()
+    return sender.status()
+
+@router.post("/outbox/retry-failed")
+async def retry_failed_outbox(api_key: str = Depends(get_api_key)):
+    """Put permanently failed messages back in the queue, e.g. after fixing a relay or directory problem."""
+    sender = get_outbox_sender()
+    requeued = sender.outbox.requeue_failed()
+    logger.info(f"Requeued {requeued} failed outbox messages")
+    return {**sender.status(), 'requeued': requeued}
+
+PROFILE_MEDIA_TYPES = {
+    "prof": "application/octet-stream",
+    "html": "text/html",
+    "txt": "text/plain",
+    "json": "application/json",
+}
+
+@router.get("/admin/profiles")
+async def get_profiles(api_key: str = Depends(get_api_key)):
+    """List stored request profiles, newest first."""
+    return {"profiles": list_profiles()}
+
+@router.get("/admin/profiles/{profile_id}.{extension}")
+async def download_profile(profile_id: str, extension: str, api_key: str = Depends(get_api_key)):
+    """Download one profile artifact (.prof, .html, .txt or .json)."""
+    path = profile_artifact_path(profile_id, extension)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type=PROFILE_MEDIA_TYPES[extension], filename=f"{profile_id}.{extension}")
+
+@router.get("/ready")
+async def readiness_check():
+    """Readiness probe for launchers: 503 until the heavy imports have been warmed up."""
+    status = readiness()
+    if not status['ready']:
+        return JSONResponse(status_code=503, content=status)
+    return status
+
 # Error handlers
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request, exc):
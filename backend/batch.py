@@ -0,0 +1,102 @@
+"""
+Parallel preparation of multi-file batch campaigns.
+
+Parsing, validation and chart rendering for each business unit's export are
+CPU bound and independent. They run in a shared process pool, one file per
+task, so pyplot only ever runs single-threaded inside a worker. The prepared
+frames and charts then go through the normal process_supervisors dispatch,
+whose SMTP sessions share the global adaptive concurrency limit and outbox.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from io import BytesIO
+from typing import Dict, List, Optional
+
+from .lazy_imports import pd
+
+logger = logging.getLogger(__name__)
+
+BATCH_WORKERS = int(os.getenv('BATCH_WORKERS', str(min(4, os.cpu_count() or 1))))
+EXCEL_EXTENSIONS = ('.xlsx', '.xls')
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def get_batch_pool() -> ProcessPoolExecutor:
+    """
+    Shared worker pool, created on first use.
+
+    Uses the spawn start method: forking the threaded API process could copy held locks.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(max_workers=BATCH_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+    return _pool
+
+
+def read_export(filename: str, content: bytes) -> 'pd.DataFrame':
+    """Parse an uploaded CSV or Excel export."""
+    if (filename or '').lower().endswith(EXCEL_EXTENSIONS):
+        return pd.read_excel(BytesIO(content))
+    return pd.read_csv(BytesIO(content))
+
+
+def trend_history(data: 'pd.DataFrame', trend_weeks: int, taken_on: Optional[date]) -> Optional[Dict[str, List[float]]]:
+    """
+    Past due history for the trend chart, ending with this export's values.
+
+    The snapshot itself is recorded later by the API process, so earlier snapshots
+    are read from the store and the current values appended here.
+    """
+    from .ge_automatic_email_tracking import supervisor_frame
+    from .metrics_store import get_metrics_store
+
+    store = get_metrics_store()
+    if store is None or trend_weeks <= 0:
+        return None
+    past_due = supervisor_frame(data).drop_duplicates('supervisor', keep='last').set_index('supervisor')['past_due']
+    history = store.trends(past_due.index, weeks=trend_weeks, before=taken_on or date.today())
+    for supervisor, value in past_due.items():
+        history.setdefault(supervisor, []).append(float(value))
+    return history
+
+
+def prepare_export(
+    filename: str,
+    content: bytes,
+    trend_weeks: int = 0,
+    taken_on: Optional[date] = None
+) -> Dict[str, object]:
+    """
+    Worker task: parse, validate and render the chart for one export.
+
+    With trend_weeks > 0 the chart includes past due trend lines from the metrics
+    history. Returns a dict with the frame and chart, or with an error message; it
+    never raises, so one bad file cannot fail the whole batch.
+    """
+    from .ge_automatic_email_tracking import generate_chart
+    from .validation import validate_export
+
+    try:
+        data = read_export(filename, content)
+        validate_export(data)
+    except Exception as e:
+        return {'filename': filename, 'data': None, 'chart': None, 'error': str(e)}
+
+    history = None
+    try:
+        history = trend_history(data, trend_weeks, taken_on)
+    except Exception as e:
+        # History problems never block sending; fall back to the plain chart
+        logger.error(f"Error loading metrics history for {filename}: {str(e)}")
+    try:
+        return {'filename': filename, 'data': data, 'chart': generate_chart(data, history=history), 'error': None}
+    except Exception as e:
+        return {'filename': filename, 'data': None, 'chart': None, 'error': str(e)}
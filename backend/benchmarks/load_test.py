@@ -0,0 +1,280 @@
+"""
+In-process load test for the HTTP API.
+
+Drives /api/upload-csv, /api/preview-email and /api/process-emails concurrently
+through httpx's ASGI transport (no network, no uvicorn) with synthetic exports of
+several sizes. A local SMTP sink stands in for the relay so process-emails does
+real SMTP round-trips without sending anything.
+
+Reports p50/p95/p99 latency, throughput and peak RSS per endpoint and size, as
+JSON so runs can be compared over time:
+    python -m backend.benchmarks.load_test --sizes 50,500,2000 --output run.json
+    python -m backend.benchmarks.load_test --output new.json --compare run.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import socketserver
+import statistics
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+ENDPOINTS = ('/api/upload-csv', '/api/preview-email', '/api/process-emails')
+
+EXPORT_COLUMNS = [
+    'Supervisor', 'Organisation', 'Region', 'Function', 'Course', 'Unit', 'Type', 'Status',
+    'Assigned', 'Due', 'Total', 'Completed', 'In Progress', 'Past Due', 'Pending',
+]
+
+
+class SmtpSinkHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP for smtplib.send_message; every message is accepted and discarded."""
+
+    def reply(self, line: str) -> None:
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self) -> None:
+        self.reply('220 loadtest SMTP sink')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors='replace').strip().upper()
+            if command.startswith(('EHLO', 'HELO')):
+                self.reply('250 loadtest')
+            elif command.startswith('DATA'):
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                while self.rfile.readline() not in (b'.\r\n', b'.\n', b''):
+                    pass
+                self.server.messages += 1
+                self.reply('250 OK queued')
+            elif command.startswith('QUIT'):
+                self.reply('221 Bye')
+                return
+            else:
+                # MAIL FROM, RCPT TO, RSET, NOOP
+                self.reply('250 OK')
+
+
+class SmtpSink(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), SmtpSinkHandler)
+        self.messages = 0
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def start(self) -> 'SmtpSink':
+        threading.Thread(target=self.serve_forever, name='smtp-sink', daemon=True).start()
+        return self
+
+
+def make_export(rows: int, seed: int = 0) -> bytes:
+    """
+    Synthetic Course Units (2) export: a sub-header row, `rows` supervisors and three
+    trailing total rows, with roughly a third of supervisors fully complete.
+    """
+    rng = random.Random(seed)
+    lines = [','.join(EXPORT_COLUMNS), ','.join(['Course Units (2)'] + [''] * (len(EXPORT_COLUMNS) - 1))]
+    for i in range(rows):
+        total = rng.randint(5, 200)
+        completed = total if rng.random() < 0.33 else rng.randint(0, total)
+        past_due = rng.randint(0, total - completed)
+        pending = total - completed - past_due
+        lines.append(','.join(map(str, [
+            f'"Surname{i}, Name [2231{i:05d}]"', 'GE Aerospace', rng.choice(['EU', 'NA', 'APAC']),
+            'Engineering', f'Course {i % 40}', 'Unit', 'Mandatory', 'Open', total, '2026-12-31',
+            total, completed, 0, past_due, pending,
+        ])))
+    for label in ('Subtotal', 'Total', 'Grand Total'):
+        lines.append(','.join([label] + ['0'] * (len(EXPORT_COLUMNS) - 1)))
+    return ('\n'.join(lines) + '\n').encode()
+
+
+class RssSampler:
+    """Samples resident set size in a thread; `peak_mb` is the maximum since the last reset."""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        try:
+            import psutil
+            self._process = psutil.Process()
+        except ImportError:
+            self._process = None
+
+    def current(self) -> Optional[int]:
+        if self._process is not None:
+            return self._process.memory_info().rss
+        if os.path.exists('/proc/self/statm'):
+            with open('/proc/self/statm') as f:
+                return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        return None
+
+    def reset(self) -> None:
+        self.peak = self.current() or 0
+
+    @property
+    def peak_mb(self) -> Optional[float]:
+        return round(self.peak / (1024 * 1024), 1) if self.peak else None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, self.current() or 0)
+
+    def start(self) -> 'RssSampler':
+        threading.Thread(target=self._run, name='rss-sampler', daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile."""
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+async def run_endpoint(client, endpoint: str, export: bytes, requests: int, concurrency: int) -> Dict[str, object]:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors = 0
+
+    async def one_request(i: int) -> None:
+        nonlocal errors
+        files = {'file': (f'export_{i}.csv', export, 'text/csv')}
+        data = {'row_index': '1'} if endpoint == '/api/preview-email' else None
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.post(endpoint, files=files, data=data)
+            latencies.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one_request(i) for i in range(requests)))
+    wall = time.perf_counter() - started
+
+    return {
+        'errors': errors,
+        'latency_ms': {
+            'p50': round(percentile(latencies, 50), 2),
+            'p95': round(percentile(latencies, 95), 2),
+            'p99': round(percentile(latencies, 99), 2),
+            'mean': round(statistics.fmean(latencies), 2),
+            'max': round(max(latencies), 2),
+        },
+        'throughput_rps': round(requests / wall, 2),
+        'wall_seconds': round(wall, 3),
+    }
+
+
+async def run(args) -> Dict[str, object]:
+    import httpx
+
+    sink = SmtpSink().start()
+    os.environ['SMTP_SERVER'] = '127.0.0.1'
+    os.environ['SMTP_PORT'] = str(sink.port)
+    # Send inline, never profile and keep synthetic snapshots out of the metrics history
+    os.environ.pop('OUTBOX_DIR', None)
+    os.environ['PROFILING_ENABLED'] = 'false'
+    os.environ['METRICS_HISTORY_ENABLED'] = 'false'
+    from backend.api import app
+
+    sampler = RssSampler().start()
+    results = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://loadtest', timeout=None) as client:
+        for rows in args.sizes:
+            export = make_export(rows, seed=args.seed)
+            for endpoint in args.endpoints:
+                requests = args.requests
+                if endpoint == '/api/process-emails':
+                    requests = max(1, args.requests // args.process_divisor)
+                sent_before = sink.messages
+                sampler.reset()
+                result = await run_endpoint(client, endpoint, export, requests, args.concurrency)
+                result.update({
+                    'endpoint': endpoint,
+                    'rows': rows,
+                    'file_kib': round(len(export) / 1024, 1),
+                    'requests': requests,
+                    'concurrency': args.concurrency,
+                    'peak_rss_mb': sampler.peak_mb,
+                    'smtp_messages': sink.messages - sent_before,
+                })
+                results.append(result)
+                print(
+                    f"{endpoint:<22} rows={rows:<6} p50={result['latency_ms']['p50']:>9}ms "
+                    f"p95={result['latency_ms']['p95']:>9}ms p99={result['latency_ms']['p99']:>9}ms "
+                    f"rps={result['throughput_rps']:>7} rss={result['peak_rss_mb']}MB errors={result['errors']}"
+                )
+    sampler.stop()
+    sink.shutdown()
+
+    return {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'sizes': args.sizes,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'seed': args.seed,
+        },
+        'results': results,
+    }
+
+
+def compare(current: Dict[str, object], baseline_path: str) -> None:
+    """Print p95 and throughput changes against a previous run."""
+    with open(baseline_path) as f:
+        baseline = {(r['endpoint'], r['rows']): r for r in json.load(f)['results']}
+    print(f"\nCompared with {baseline_path}:")
+    for result in current['results']:
+        before = baseline.get((result['endpoint'], result['rows']))
+        if before is None:
+            continue
+        p95_change = (result['latency_ms']['p95'] / before['latency_ms']['p95'] - 1) * 100
+        rps_change = (result['throughput_rps'] / before['throughput_rps'] - 1) * 100
+        print(f"{result['endpoint']:<22} rows={result['rows']:<6} p95 {p95_change:+.1f}%  throughput {rps_change:+.1f}%")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=lambda v: [int(x) for x in v.split(',')], default=[50, 500, 2000],
+                        help='comma separated supervisor row counts')
+    parser.add_argument('--endpoints', type=lambda v: v.split(','), default=list(ENDPOINTS))
+    parser.add_argument('--requests', type=int, default=40, help='requests per endpoint and size')
+    parser.add_argument('--process-divisor', type=int, default=4,
+                        help='process-emails sends one email per row, so it runs requests/divisor requests')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--compare', help='previous results JSON to compare against')
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""
+Startup-time benchmark for the FastAPI backend.
+
+Measures, over several cold starts of a fresh interpreter:
+- import time of the app module (what every pm2 watch restart pays)
+- time until the server accepts its first request
+- time until /api/ready reports the heavy imports as warmed up
+
+Run from the repository root:
+    python -m backend.benchmarks.startup_benchmark --runs 5 --max-first-request 2.0
+A non-zero exit code means a threshold was exceeded, so it can gate CI.
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from typing import Dict, List, Optional
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def measure_import(app_module: str) -> float:
+    """Import the app module in a fresh interpreter and return the wall time of the import."""
+    code = (
+        "import time; started = time.perf_counter(); "
+        f"import {app_module}; "
+        "print(time.perf_counter() - started)"
+    )
+    env = dict(os.environ, API_KEY=os.getenv('API_KEY', 'benchmark'))
+    output = subprocess.check_output([sys.executable, '-c', code], cwd=REPO_ROOT, env=env)
+    return float(output.decode().strip().splitlines()[-1])
+
+
+def poll(url: str, started: float, timeout: float, want_status: int = 200) -> Optional[float]:
+    """Return seconds since `started` when `url` first answers with `want_status`."""
+    while time.perf_counter() - started < timeout:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == want_status:
+                    return time.perf_counter() - started
+        except urllib.error.HTTPError as e:
+            if e.code == want_status:
+                return time.perf_counter() - started
+        except (urllib.error.URLError, ConnectionError, TimeoutError):
+            pass
+        time.sleep(0.02)
+    return None
+
+
+def measure_server(app: str, timeout: float) -> Dict[str, Optional[float]]:
+    """Start uvicorn and time the first answered request and readiness."""
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    env = dict(os.environ, API_KEY=os.getenv('API_KEY', 'benchmark'))
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', app, '--host', '127.0.0.1', '--port', str(port), '--log-level', 'warning'],
+        cwd=REPO_ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        first_request = poll(f"{base_url}/test", started, timeout)
+        ready = poll(f"{base_url}/api/ready", started, timeout)
+        return {'first_request': first_request, 'ready': ready}
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def summarise(samples: List[Optional[float]]) -> Dict[str, Optional[float]]:
+    values = [s for s in samples if s is not None]
+    if not values:
+        return {'min': None, 'median': None, 'max': None, 'failures': len(samples)}
+    return {
+        'min': round(min(values), 4),
+        'median': round(statistics.median(values), 4),
+        'max': round(max(values), 4),
+        'failures': len(samples) - len(values),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--app', default='backend.api:app', help='uvicorn app to start')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--timeout', type=float, default=60.0)
+    parser.add_argument('--max-import', type=float, help='fail if median import time exceeds this (s)')
+    parser.add_argument('--max-first-request', type=float, help='fail if median time to first request exceeds this (s)')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args(argv)
+
+    app_module = args.app.split(':')[0]
+    imports, first_requests, readies = [], [], []
+    for run in range(args.runs):
+        imports.append(measure_import(app_module))
+        server = measure_server(args.app, args.timeout)
+        first_requests.append(server['first_request'])
+        readies.append(server['ready'])
+        print(f"run {run + 1}: import={imports[-1]:.3f}s first_request={server['first_request']} ready={server['ready']}")
+
+    results = {
+        'app': args.app,
+        'runs': args.runs,
+        'python': sys.version.split()[0],
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'import': summarise(imports),
+        'first_request': summarise(first_requests),
+        'ready': summarise(readies),
+    }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    failed = False
+    if args.max_import is not None and results['import']['median'] > args.max_import:
+        print(f"Median import time {results['import']['median']}s exceeds {args.max_import}s")
+        failed = True
+    if args.max_first_request is not None:
+        median = results['first_request']['median']
+        if median is None or median > args.max_first_request:
+            print(f"Median time to first request {median}s exceeds {args.max_first_request}s")
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,146 @@
+"""
+Scheduled email campaigns, run outside the API process.
+
+APScheduler hands campaign jobs to a dedicated process pool so CSV parsing,
+chart rendering and sending never compete with request handling for the GIL.
+Each job runs with max_instances=1 and coalescing by default, so overlapping
+cron fires of the same campaign are skipped rather than sending twice. Workers
+run at a lower priority and can be capped in CPU time and address space.
+
+Workers render and spool messages to the campaign outbox (CAMPAIGN_OUTBOX_DIR,
+the main outbox if OUTBOX_DIR is set) instead of opening SMTP sessions, so bulk
+scheduled traffic shares the scheduler process's adaptive SMTP limit and shows up
+in /api/smtp/status.
+"""
+import logging
+import multiprocessing
+import os
+from typing import Dict, Optional, Tuple
+
+from apscheduler.events import EVENT_JOB_ERROR, EVENT_JOB_MAX_INSTANCES, EVENT_JOB_MISSED
+from apscheduler.executors.pool import ProcessPoolExecutor
+
+from .lazy_imports import pd
+
+logger = logging.getLogger(__name__)
+
+CAMPAIGN_EXECUTOR = 'campaigns'
+CAMPAIGN_WORKERS = int(os.getenv('CAMPAIGN_WORKERS', '2'))
+# Seconds a fire may be late (e.g. after a restart) and still run; later fires are skipped
+CAMPAIGN_MISFIRE_GRACE = int(os.getenv('CAMPAIGN_MISFIRE_GRACE', '900'))
+# Per-campaign limits; 0 disables the limit
+CAMPAIGN_CPU_SECONDS = int(os.getenv('CAMPAIGN_CPU_SECONDS', '0'))
+CAMPAIGN_MEMORY_MB = int(os.getenv('CAMPAIGN_MEMORY_MB', '0'))
+CAMPAIGN_NICE = int(os.getenv('CAMPAIGN_NICE', '10'))
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; CPU and memory limits are skipped there
+    resource = None
+
+
+def init_campaign_worker(niceness: int = CAMPAIGN_NICE) -> None:
+    """Process pool initializer: run campaign workers below the API's priority."""
+    if niceness and hasattr(os, 'nice'):
+        os.nice(niceness)
+
+
+def apply_campaign_limits(cpu_seconds: int = CAMPAIGN_CPU_SECONDS, memory_mb: int = CAMPAIGN_MEMORY_MB) -> None:
+    """
+    Cap the CPU time and address space of the current campaign.
+
+    Workers are reused across campaigns, so the CPU limit is set relative to the
+    CPU time this worker has already used.
+    """
+    if resource is None:
+        if cpu_seconds or memory_mb:
+            logger.warning("Campaign CPU/memory limits are not supported on this platform")
+        return
+    if cpu_seconds:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+        soft = int(usage.ru_utime + usage.ru_stime) + cpu_seconds
+        resource.setrlimit(resource.RLIMIT_CPU, (soft if hard == resource.RLIM_INFINITY else min(soft, hard), hard))
+    if memory_mb:
+        _, hard = resource.getrlimit(resource.RLIMIT_AS)
+        soft = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (soft if hard == resource.RLIM_INFINITY else min(soft, hard), hard))
+
+
+def load_export(data_path: str) -> 'pd.DataFrame':
+    """Read a CSV or Excel export from disk."""
+    if data_path.lower().endswith(('.xlsx', '.xls')):
+        return pd.read_excel(data_path)
+    return pd.read_csv(data_path)
+
+
+def record_campaign_snapshot(campaign_id: str, data: 'pd.DataFrame') -> None:
+    """Store this run's per-supervisor metrics; history problems are logged and never block sending."""
+    from .ge_automatic_email_tracking import collect_supervisor_metrics
+    from .metrics_store import get_metrics_store
+
+    store = get_metrics_store()
+    if store is None:
+        return
+    try:
+        metrics, emails, _ = collect_supervisor_metrics(data)
+        store.record_snapshot(metrics, emails, source=campaign_id)
+    except Exception as e:
+        logger.error(f"Campaign {campaign_id} could not record metrics history: {str(e)}")
+
+
+def run_campaign(
+    campaign_id: str,
+    data_path: str,
+    template: Optional[Dict[str, str]] = None,
+    pacing: Optional[Dict[str, object]] = None
+) -> Tuple[int, int]:
+    """
+    Job entry point executed in a campaign worker process.
+
+    Must stay a module-level function with picklable arguments so APScheduler can
+    ship it to the process pool. `pacing` holds window_start/window_end/max_per_minute
+    for paced delivery. Each run also records a metrics history snapshot, with the
+    campaign id as its source.
+    """
+    from .ge_automatic_email_tracking import process_supervisors
+    from .outbox import get_campaign_outbox
+    from .pacing import DeliveryPacer
+    from .validation import validate_export
+
+    apply_campaign_limits()
+    logger.info(f"Campaign {campaign_id} started in worker {os.getpid()} for {data_path}")
+    data = load_export(data_path)
+    validate_export(data)
+    record_campaign_snapshot(campaign_id, data)
+    pacer = DeliveryPacer.from_config(pacing)
+    # Spool only: the scheduler process delivers under the shared SMTP limit
+    success_count, failure_count = process_supervisors(data, template, outbox=get_campaign_outbox(), pacer=pacer)
+    logger.info(f"Campaign {campaign_id} completed. Queued: {success_count}, Failures: {failure_count}")
+    return success_count, failure_count
+
+
+def build_campaign_executor(workers: int = CAMPAIGN_WORKERS) -> ProcessPoolExecutor:
+    """Campaign pool using spawn, like the batch pool: forking the threaded API process could copy held locks."""
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        pool_kwargs={
+            'initializer': init_campaign_worker,
+            'initargs': (CAMPAIGN_NICE,),
+            'mp_context': multiprocessing.get_context('spawn'),
+        }
+    )
+
+
+def log_campaign_event(event) -> None:
+    """Scheduler listener for campaign fires that were skipped or failed."""
+    if event.code == EVENT_JOB_MISSED:
+        logger.warning(f"Campaign {event.job_id} missed its run at {event.scheduled_run_time}; skipped")
+    elif event.code == EVENT_JOB_MAX_INSTANCES:
+        logger.warning(f"Campaign {event.job_id} is still running; overlapping fire skipped")
+    elif event.code == EVENT_JOB_ERROR:
+        logger.error(f"Campaign {event.job_id} failed: {event.exception}")
+
+
+CAMPAIGN_EVENTS = EVENT_JOB_MISSED | EVENT_JOB_MAX_INSTANCES | EVENT_JOB_ERROR
@@ -0,0 +1,51 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+# Upper bound on the PNG bytes kept in memory; least recently used charts are evicted first
+CHART_CACHE_MAX_BYTES = int(os.getenv('CHART_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+
+
+class ChartStore:
+    """
+    Content-addressed, size-bounded in-memory store for rendered chart images.
+
+    Charts are keyed by the SHA-256 of their PNG bytes, so a key always maps to the
+    same image and can be served with an immutable cache policy and a strong ETag.
+    """
+
+    def __init__(self, max_bytes: int = CHART_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._charts: "OrderedDict[str, bytes]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def digest(chart: bytes) -> str:
+        return hashlib.sha256(chart).hexdigest()
+
+    def put(self, chart: bytes) -> str:
+        """Store a chart and return its content digest."""
+        key = self.digest(chart)
+        with self._lock:
+            if key in self._charts:
+                self._charts.move_to_end(key)
+                return key
+            self._charts[key] = chart
+            self._size += len(chart)
+            while self._size > self.max_bytes and len(self._charts) > 1:
+                _, evicted = self._charts.popitem(last=False)
+                self._size -= len(evicted)
+        return key
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            chart = self._charts.get(key)
+            if chart is not None:
+                self._charts.move_to_end(key)
+            return chart
+
+
+chart_store = ChartStore()
@@ -6,6 +6,8 @@ module.exports = {
         args: '-m uvicorn main:app --host 0.0.0.0 --port 8000',
         cwd: './backend',
         watch: true,
+        // Log and data files are written into cwd; watching them would restart the API in a loop
+        ignore_watch: ['*.log', '__pycache__', 'benchmarks', 'outbox', 'profiles', '*.db', '*.db-*'],
         env: {
           NODE_ENV: 'production',
         },
@@ -1,14 +1,22 @@
+from __future__ import annotations
+
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.image import MIMEImage
+from email.message import Message
 from io import BytesIO
-from typing import Optional, Tuple, Dict, List
-from collections import defaultdict
-import pandas as pd
-import matplotlib.pyplot as plt
+from typing import Optional, Tuple, Dict, List, Iterator, TYPE_CHECKING
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 import smtplib
 import os
 import logging
+from .lazy_imports import pd, plt
+from .smtp_concurrency import smtp_controller
+from .recipients import get_recipient_resolver
+
+if TYPE_CHECKING:
+    from .outbox import Outbox
+    from .pacing import DeliveryPacer
 
 # Configure logging
 logging.basicConfig(
@@ -60,73 +68,120 @@ def safe_convert_to_float(value: any) -> float:
         return 0.0
 
 
-def extract_sso_id(supervisor: str) -> Optional[str]:
-    """Extract SSO ID from supervisor string and return email address."""
-    try:
-        if pd.isna(supervisor) or not isinstance(supervisor, str):
-            return None
-        if '[' in supervisor and ']' in supervisor:
-            sso_id = supervisor.split('[')[-1].strip(']').strip()
-            return f"{sso_id}@geaerospace.com"
-        return None
-    except Exception as e:
-        logger.error(f"Error extracting SSO ID from '{supervisor}': {str(e)}")
-        return None
+# Column positions in the Course Units (2) export
+SUPERVISOR_COLUMN = 0
+METRIC_COLUMNS = {'total': 10, 'completed': 11, 'past_due': 13, 'pending': 14}
+# SSO ID inside the last pair of square brackets, e.g. "Smith, John [223144086]"
+SSO_ID_PATTERN = r'\[\s*([^\[\]]+?)\s*\][^\[]*$'
+
+
+def extract_sso_ids(supervisors: pd.Series) -> pd.Series:
+    """Vectorised SSO ID extraction: the bracketed ID per row, <NA> where none is present."""
+    return supervisors.astype('string').str.extract(SSO_ID_PATTERN, expand=False)
+
+
+def supervisor_frame(data: pd.DataFrame) -> pd.DataFrame:
+    """
+    Course Units (2) rows as a typed frame with supervisor, sso_id and numeric metric columns.
+
+    Uses whole-column operations instead of per-row iloc, and treats missing or
+    non-numeric metrics as 0 like safe_convert_to_float. Rows without a supervisor are dropped.
+    """
+    start_idx, end_idx = get_course_unit_2_indices(data)
+    if start_idx is None or end_idx is None:
+        raise ValueError("Could not find Course Units (2) section")
 
+    section = data.iloc[start_idx:end_idx-3]
+    frame = pd.DataFrame({'supervisor': section.iloc[:, SUPERVISOR_COLUMN].astype('string')}, index=section.index)
+    for name, column in METRIC_COLUMNS.items():
+        frame[name] = pd.to_numeric(section.iloc[:, column], errors='coerce').fillna(0.0).astype(float)
 
-def generate_chart(data: pd.DataFrame) -> bytes:
+    frame = frame[frame['supervisor'].str.strip().fillna('') != ''].copy()
+    frame['sso_id'] = extract_sso_ids(frame['supervisor'])
+    frame['completion_rate'] = (frame['completed'] / frame['total'] * 100).where(frame['total'] > 0, 0.0)
+    return frame
+
+
+CHART_CATEGORIES = ['Completed', 'Pending', 'Past Due']
+CHART_COLORS = ['#2ecc71', '#f1c40f', '#e74c3c']
+
+
+def compute_chart_data(data: pd.DataFrame) -> Tuple[Dict[str, Dict[str, float]], List[str], float]:
+    """
+    Collect the per-supervisor chart series with column-wise operations.
+
+    Returns the Completed/Pending/Past Due metrics keyed by supervisor, the supervisors
+    in plotting order and the largest stacked total (used for the axis limits).
+    """
+    frame = supervisor_frame(data).drop_duplicates('supervisor', keep='last')
+    series = frame.set_index('supervisor')[['completed', 'pending', 'past_due']]
+    series.columns = CHART_CATEGORIES
+
+    chart_data = series.to_dict('index')
+    max_total = float(series.sum(axis=1).max()) if len(series) else 0
+
+    sorted_supervisors = sorted(chart_data.keys(), reverse=True)
+    return chart_data, sorted_supervisors, max_total
+
+
+def _plot_trend_lines(ax, sorted_supervisors: List[str], history: Dict[str, List[float]]) -> None:
+    """Draw each supervisor's past due history as a sparkline in its own row band."""
+    for idx, supervisor in enumerate(sorted_supervisors):
+        values = history.get(supervisor) or []
+        if len(values) < 2:
+            continue
+        low, high = min(values), max(values)
+        span = (high - low) or 1
+        # Scale into the bar's row band so rows never overlap
+        ax.plot(
+            range(len(values)),
+            [idx - 0.3 + (v - low) / span * 0.6 for v in values],
+            color=CHART_COLORS[2],
+            linewidth=1
+        )
+        ax.text(len(values) - 0.5, idx, f"{int(values[-1] - values[0]):+d}", va='center', ha='left', fontsize=8)
+
+    ax.set_title('Past Due trend', fontsize=10, pad=50)
+    ax.set_xticks([])
+    ax.tick_params(axis='y', left=False, labelleft=False)
+    for spine in ax.spines.values():
+        spine.set_visible(False)
+
+
+def generate_chart(data: pd.DataFrame, history: Optional[Dict[str, List[float]]] = None) -> bytes:
     """
     Generate a visualisation chart for the email.
 
+    history optionally maps supervisors to their past due counts over previous
+    snapshots (oldest first, e.g. from MetricsStore.trends); when given, a trend
+    column is drawn next to the bars.
+
     Optimising chart generation using data structures:
     - dict: O(1) lookup for supervisor data
     - minimise DataFrame operations to reduce processing time
     - process data in single pass
     """
     try:
-        # Get Course Units (2) section
-        start_idx, end_idx = get_course_unit_2_indices(data)
-        if start_idx is None or end_idx is None:
-            raise ValueError("Could not find Course Units (2) section")
-            
-        # Prepare data for visualisation in a single pass
-        chart_data = {}
-        max_total = 0
-
-        for idx in range(start_idx, end_idx-3):
-            row = data.iloc[idx]
-            supervisor = str(row.iloc[0])
-
-            if pd.isna(supervisor) or supervisor.strip() == '':
-                continue
-
-            metrics = {
-                'Completed': safe_convert_to_float(row.iloc[11]),
-                'Pending': safe_convert_to_float(row.iloc[14]),
-                'Past Due': safe_convert_to_float(row.iloc[13])
-            }
-
-            total = sum(metrics.values())
-            max_total = max(max_total, total)
-            chart_data[supervisor] = metrics
-
-        sorted_supervisors = sorted(chart_data.keys(), reverse=True)
+        chart_data, sorted_supervisors, max_total = compute_chart_data(data)
         
         # Create plot with pre-calculated dimensions
         num_supervisors = len(sorted_supervisors)
         fig_height = max(6, num_supervisors * 0.4)
-        fig, ax = plt.subplots(figsize=(12, fig_height))
+        if history:
+            fig, (ax, trend_ax) = plt.subplots(
+                1, 2, figsize=(14, fig_height), sharey=True, gridspec_kw={'width_ratios': [5, 1]}
+            )
+        else:
+            fig, ax = plt.subplots(figsize=(12, fig_height))
         
         ax.spines['top'].set_visible(False)
         ax.spines['right'].set_visible(False)
         
         y_positions = range(num_supervisors)
         left_values = [0] * num_supervisors
-        colors = ['#2ecc71', '#f1c40f', '#e74c3c']
-        categories = ['Completed', 'Pending', 'Past Due']
         
         # Plot bars efficiently
-        for category, color in zip(categories, colors):
+        for category, color in zip(CHART_CATEGORIES, CHART_COLORS):
             values = [chart_data[sup][category] for sup in sorted_supervisors]
             ax.barh(y_positions, values, left=left_values, color=color, label=category)
             left_values = [l + v for l, v in zip(left_values, values)]
@@ -143,14 +198,16 @@ def generate_chart(data: pd.DataFrame) -> bytes:
             text = f"{int(metrics['Completed'])} | {int(metrics['Pending'])} | {int(metrics['Past Due'])}"
             ax.text(max_total * 1.02, idx, text, va='center', ha='left', fontsize=9)
         
-        plt.xlim(0, max_total * 1.2)
+        ax.set_xlim(0, max_total * 1.2)
         ax.axvline(x=max_total, color='gray', linestyle='--', linewidth=0.8)
-        plt.tight_layout()
+        if history:
+            _plot_trend_lines(trend_ax, sorted_supervisors, history)
+        fig.tight_layout()
         
         img_buffer = BytesIO()
-        plt.savefig(img_buffer, format='png', bbox_inches='tight', dpi=300)
+        fig.savefig(img_buffer, format='png', bbox_inches='tight', dpi=300)
         img_buffer.seek(0)
-        plt.close()
+        plt.close(fig)
         
         return img_buffer.getvalue()
         
@@ -214,6 +271,41 @@ def create_email_content(
 # DEV_MODE = os.getenv('DEV_MODE', 'False').lower() == 'true'
 
 
+def build_email_message(
+    recipient: str,
+    subject: str,
+    content: str,
+    chart: bytes,
+    sender: Optional[str] = None
+) -> MIMEMultipart:
+    """Assemble the MIME message with the HTML body and the inline chart."""
+    msg = MIMEMultipart()
+    msg['From'] = sender or os.getenv('SMTP_SENDER', '223144086@geaerospace.com')
+    msg['To'] = recipient
+    msg['Subject'] = subject
+    
+    # Attach HTML content
+    msg.attach(MIMEText(content, 'html'))
+    
+    # Attach chart
+    img = MIMEImage(chart)
+    img.add_header('Content-ID', '<task_chart>')
+    msg.attach(img)
+    
+    return msg
+
+
+def deliver_message(msg: Message) -> None:
+    """
+    Hand a fully rendered message to the SMTP relay. Raises on failure.
+
+    Every session goes through the shared AIMD controller, which caps the number of
+    concurrent sessions and adapts that cap to relay latency and 421/45x replies.
+    """
+    with smtp_controller.session(), smtplib.SMTP(os.getenv('SMTP_SERVER', 'e2ksmtp01.e2k.ad.ge.com'), int(os.getenv('SMTP_PORT', '25'))) as server:
+        server.send_message(msg)
+
+
 def send_email(
     recipient: str,
     subject: str,
@@ -223,24 +315,19 @@ def send_email(
 ) -> bool:
     """Send email with chart attachment."""
     try:
-        msg = MIMEMultipart()
-        msg['From'] = sender or os.getenv('SMTP_SENDER', '223144086@geaerospace.com')
-        msg['To'] = recipient
-        msg['Subject'] = subject
-        
-        # Attach HTML content
-        msg.attach(MIMEText(content, 'html'))
-        
-        # Attach chart
-        img = MIMEImage(chart)
-        img.add_header('Content-ID', '<task_chart>')
-        msg.attach(img)
-        
-        # Send email
-        with smtplib.SMTP(os.getenv('SMTP_SERVER', 'e2ksmtp01.e2k.ad.ge.com'), 25) as server:
-            server.send_message(msg)
-            logger.info(f"Email sent successfully to {recipient}")
-            return True
+        return send_message(build_email_message(recipient, subject, content, chart, sender))
+    except Exception as e:
+        logger.error(f"Failed to send email to {recipient}: {str(e)}")
+        return False
+
+
+def send_message(msg: Message) -> bool:
+    """Send an already rendered message, logging instead of raising."""
+    recipient = msg['To']
+    try:
+        deliver_message(msg)
+        logger.info(f"Email sent successfully to {recipient}")
+        return True
     except smtplib.SMTPException as smtp_err:
             logger.error(f"SMTP Error: {str(smtp_err)}")
             return False
@@ -280,84 +367,140 @@ def send_test_email(
         return False
 
 
+def collect_supervisor_metrics(
+    data: pd.DataFrame
+) -> Tuple[Dict[str, Dict[str, float]], Dict[str, str], Dict[str, List[int]]]:
+    """
+    Compute per-supervisor metrics, recipient addresses and the supervisors that need an email.
+    
+    Optimising performance by using data structures:
+    - vectorised column operations instead of per-row access
+    - pre-calculating metrics and storing in a cache
+    - grouping pending task rows by supervisor
+    """
+    frame = supervisor_frame(data)
+    latest = frame.drop_duplicates('supervisor', keep='last').set_index('supervisor')
+
+    metrics_cache = latest[['total', 'completed', 'past_due', 'pending', 'completion_rate']].to_dict('index')
+    # Batch directory lookup; unknown or departed SSOs resolve to None and get no email
+    sso_ids = latest['sso_id'].dropna()
+    addresses = get_recipient_resolver().resolve_many(sso_ids.unique().tolist())
+    supervisor_emails = {
+        supervisor: addresses[sso] for supervisor, sso in sso_ids.items() if addresses.get(sso)
+    } # "223144086@geaerospace.com"
+
+    # Check if email needed
+    needs_email = frame[(frame['pending'] > 0) | (frame['past_due'] > 0)]
+    pending_tasks = {
+        supervisor: list(indices)
+        for supervisor, indices in needs_email.groupby('supervisor', sort=False).groups.items()
+    }
+
+    return metrics_cache, supervisor_emails, pending_tasks
+
+
+def render_supervisor_emails(
+    data: pd.DataFrame,
+    email_template: Optional[Dict[str, str]] = None,
+    chart: Optional[bytes] = None,
+    collected: Optional[Tuple[Dict[str, Dict[str, float]], Dict[str, str], Dict[str, List[int]]]] = None
+) -> Iterator[Tuple[str, Optional[MIMEMultipart]]]:
+    """
+    Lazily render one message per supervisor with pending or past due tasks.
+
+    Yields (supervisor, message); message is None when the supervisor has no usable
+    address or rendering failed, so callers can count it as a failure. Pass the
+    result of collect_supervisor_metrics as `collected` if it is already computed.
+    """
+    metrics_cache, supervisor_emails, pending_tasks = collected or collect_supervisor_metrics(data)
+    if chart is None:
+        chart = generate_chart(data)
+    subject = email_template.get('subject', EmailTemplate.DEFAULT_TEMPLATE['subject']) if email_template else EmailTemplate.DEFAULT_TEMPLATE['subject']
+
+    for supervisor in pending_tasks:
+        if supervisor not in supervisor_emails:
+            logger.error(f"No email address for supervisor (missing SSO ID or not in directory): {supervisor}")
+            yield supervisor, None
+            continue
+
+        try:
+            content = create_email_content(metrics_cache[supervisor], email_template)
+            msg = build_email_message(supervisor_emails[supervisor], subject, content, chart)
+        except Exception as e:
+            logger.error(f"Error rendering email for supervisor {supervisor}: {str(e)}")
+            msg = None
+        yield supervisor, msg
+
+
 def process_supervisors(
     data: pd.DataFrame,
     email_template: Optional[Dict[str, str]] = None,
-    send_test: bool = False
+    send_test: bool = False,
+    outbox: Optional["Outbox"] = None,
+    chart: Optional[bytes] = None,
+    pacer: Optional["DeliveryPacer"] = None
 ) -> Tuple[int, int]:
     """
     Process supervisor data and send emails.
     
-    Optimising performance by using data structures:
-    - defaultdict: grouping pending tasks by supervisor
-    - pre-calculating metrics and storing in a cache
-    - batch process similar operations to reduce duplicate work
+    When an outbox is given the rendered messages are only spooled to it and the
+    success count is the number queued; an OutboxSender delivers them separately.
+    A pre-rendered chart can be passed to skip rendering it again. With a pacer,
+    each send (or enqueue) waits for its slot so the campaign is spread over the
+    pacer's delivery window instead of hitting the relay all at once.
+
+    Recipients are resolved before anything is sent, and directory errors (LDAP
+    outage, missing directory file) are raised rather than reported as 0 emails.
     """
     success_count = 0
     failure_count = 0
+    collected = collect_supervisor_metrics(data)
     
     try:
-        # Get Course Units (2) section indices
-        start_idx, end_idx = get_course_unit_2_indices(data)
-        if start_idx is None or end_idx is None:
-            logger.error("Could not find Course Units (2) section")
-            return 0, 0
-        
-        metrics_cache = {}
-        supervisor_emails = {}
-        pending_tasks = defaultdict(list)
-
-        chart = generate_chart(data)
-        
-        # Process each supervisor
-        for idx in range(start_idx, end_idx-3):
-            row = data.iloc[idx]
-            supervisor = str(row.iloc[0])
-            
-            if pd.isna(supervisor) or supervisor.strip() == '':
-                continue
-            
-            metrics = {
-                'total': safe_convert_to_float(row.iloc[10]),
-                'completed': safe_convert_to_float(row.iloc[11]),
-                'past_due': safe_convert_to_float(row.iloc[13]),
-                'pending': safe_convert_to_float(row.iloc[14])
-            }
-            
-            # Calculate completion rate and store in cache
-            metrics['completion_rate'] = (metrics['completed'] / metrics['total'] * 100) if metrics['total'] > 0 else 0
-            metrics_cache[supervisor] = metrics
-
-            email = extract_sso_id(supervisor) # "223144086@geaerospace.com"
-            if email:
-                supervisor_emails[supervisor] = email
-            
-            # Check if email needed
-            if metrics['pending'] > 0 or metrics['past_due'] > 0:
-                pending_tasks[supervisor].append(idx)
-
-        for supervisor in pending_tasks:
-            if supervisor not in supervisor_emails:
-                failure_count += 1
-                continue
-
-            try:
-                email = supervisor_emails[supervisor]
-                metrics = metrics_cache[supervisor]
-                
-                content = create_email_content(metrics, email_template)
-                subject = email_template.get('subject', EmailTemplate.DEFAULT_TEMPLATE['subject']) if email_template else EmailTemplate.DEFAULT_TEMPLATE['subject']
-                
-                if send_email(email, subject, content, chart):
-                    success_count += 1
-                    logger.info(f"Successfully processed supervisor: {supervisor}")
-                else:
+        if pacer is not None:
+            # Only supervisors with a resolved address take a send slot
+            pacer.plan(sum(1 for supervisor in collected[2] if supervisor in collected[1]))
+
+        # Sends run on a thread pool; smtp_controller decides how many sessions are
+        # actually in flight, and at most max_limit messages wait here at any time
+        with ThreadPoolExecutor(max_workers=smtp_controller.max_limit, thread_name_prefix='smtp-send') as pool:
+            in_flight = {}
+
+            def collect(done) -> None:
+                nonlocal success_count, failure_count
+                for future in done:
+                    supervisor = in_flight.pop(future)
+                    if future.result():
+                        success_count += 1
+                        logger.info(f"Successfully processed supervisor: {supervisor}")
+                    else:
+                        failure_count += 1
+                        logger.error(f"Failed to send email to supervisor: {supervisor}")
+
+            for supervisor, msg in render_supervisor_emails(data, email_template, chart, collected):
+                if msg is None:
                     failure_count += 1
-                    logger.error(f"Failed to send email to supervisor: {supervisor}")
-                        
-            except Exception as e:
-                logger.error(f"Error processing supervisor {supervisor}: {str(e)}")
-                failure_count += 1
+                    continue
+
+                if pacer is not None:
+                    pacer.wait_turn()
+
+                try:
+                    if outbox is not None:
+                        outbox.enqueue(msg)
+                        success_count += 1
+                        continue
+
+                    if len(in_flight) >= smtp_controller.max_limit:
+                        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                        collect(done)
+                    in_flight[pool.submit(send_message, msg)] = supervisor
+                            
+                except Exception as e:
+                    logger.error(f"Error processing supervisor {supervisor}: {str(e)}")
+                    failure_count += 1
+
+            collect(wait(in_flight).done)
                 
     except Exception as e:
         logger.error(f"Error in process_supervisors: {str(e)}")
@@ -0,0 +1,104 @@
+import importlib
+import logging
+import os
+import threading
+import time
+from types import ModuleType
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class LazyModule(ModuleType):
+    """
+    Module proxy that defers the real import until the first attribute access.
+
+    pandas and matplotlib account for most of the backend's cold start time, so
+    modules bind them through this proxy and only pay for the import when a
+    request actually needs them (or when the background warm-up gets there first).
+    """
+
+    def __init__(self, name: str, before_load: Optional[Callable[[], None]] = None):
+        super().__init__(name)
+        self._lazy_name = name
+        self._lazy_before_load = before_load
+        self._lazy_module = None
+        self._lazy_lock = threading.Lock()
+
+    def _load(self) -> ModuleType:
+        if self._lazy_module is None:
+            with self._lazy_lock:
+                if self._lazy_module is None:
+                    started = time.perf_counter()
+                    if self._lazy_before_load:
+                        self._lazy_before_load()
+                    module = importlib.import_module(self._lazy_name)
+                    _load_times[self._lazy_name] = time.perf_counter() - started
+                    logger.info(f"Loaded {self._lazy_name} in {_load_times[self._lazy_name]:.3f}s")
+                    self._lazy_module = module
+        return self._lazy_module
+
+    def __getattr__(self, attr: str):
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._lazy_module is not None
+
+
+def _select_headless_backend() -> None:
+    """Charts are only ever rendered to PNG, so never let pyplot pick a GUI backend."""
+    if not os.getenv('MPLBACKEND'):
+        import matplotlib
+        matplotlib.use('Agg')
+
+
+_load_times: Dict[str, float] = {}
+
+pd = LazyModule('pandas')
+plt = LazyModule('matplotlib.pyplot', before_load=_select_headless_backend)
+
+HEAVY_MODULES = (pd, plt)
+
+_warmup_thread: Optional[threading.Thread] = None
+_warmup_error: Optional[str] = None
+
+
+def _warm_up() -> None:
+    global _warmup_error
+    try:
+        for module in HEAVY_MODULES:
+            module._load()
+    except Exception as e:
+        _warmup_error = str(e)
+        logger.error(f"Warm-up of heavy imports failed: {str(e)}")
+
+
+def start_warmup() -> Optional[threading.Thread]:
+    """
+    Import the heavy modules in a daemon thread so the first real request does not pay for them.
+
+    Controlled by the WARMUP_ON_STARTUP environment variable (enabled by default).
+    """
+    global _warmup_thread
+    if os.getenv('WARMUP_ON_STARTUP', 'true').lower() != 'true':
+        return None
+    if _warmup_thread is None:
+        _warmup_thread = threading.Thread(target=_warm_up, name='heavy-import-warmup', daemon=True)
+        _warmup_thread.start()
+    return _warmup_thread
+
+
+def readiness() -> Dict[str, object]:
+    """Report whether the heavy modules are loaded and how long each took to import."""
+    warming = _warmup_thread is not None and _warmup_thread.is_alive()
+    return {
+        'ready': not warming and _warmup_error is None,
+        'warming_up': warming,
+        'error': _warmup_error,
+        'modules': {module._lazy_name: module.is_loaded for module in HEAVY_MODULES},
+        'load_times': dict(_load_times),
+    }
@@ -4,14 +4,26 @@ import os
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.executors.pool import ThreadPoolExecutor
 from apscheduler.triggers.cron import CronTrigger
 from apscheduler.triggers.date import DateTrigger
 from pydantic import BaseModel
-from typing import Optional, Union
-from datetime import datetime
+from typing import Dict, Optional, Union
+from datetime import datetime, time
 from dotenv import load_dotenv
 from .api import router, initialise_api
-from .ge_automatic_email_tracking import process_supervisors
+from .lazy_imports import start_warmup
+from .outbox import start_campaign_outbox_sender, start_outbox_sender
+from .pacing import DeliveryPacer
+from .profiling import PROFILING_ENABLED, ProfilingMiddleware
+from .campaigns import (
+    CAMPAIGN_EVENTS,
+    CAMPAIGN_EXECUTOR,
+    CAMPAIGN_MISFIRE_GRACE,
+    build_campaign_executor,
+    log_campaign_event,
+    run_campaign
+)
 
 load_dotenv()
 app = FastAPI()
@@ -46,8 +58,19 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Schedule models
+class PacingConfig(BaseModel):
+    window_start: Optional[time] = None  # "08:00" - first send no earlier than this
+    window_end: Optional[time] = None  # "10:00" - sends are spread evenly up to this time
+    max_per_minute: Optional[float] = None  # Hard cap on the send rate
+
 class ScheduleBase(BaseModel):
     job_id: Optional[str] = None
+    data_path: Optional[str] = None  # CSV/Excel export the campaign is built from
+    template: Optional[Dict[str, str]] = None
+    max_instances: int = 1  # Concurrent runs allowed for this campaign
+    coalesce: bool = True  # Collapse a backlog of missed fires into one run
+    misfire_grace_time: Optional[int] = None  # Seconds late a fire may still run
+    pacing: Optional[PacingConfig] = None  # Spread delivery over a window instead of one burst
 
 class ImmediateEmailSchedule(ScheduleBase):
     send_now: bool = True
@@ -80,7 +103,55 @@ app.add_middleware(
     max_age=86400,
 )
 
-scheduler = BackgroundScheduler()
+# Opt-in request profiling (PROFILING_ENABLED / PROFILING_SAMPLE_RATE / X-Profile header)
+if PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware, api_key=lambda: API_KEY)
+
+# Campaigns run in their own process pool so bulk work never holds the API's GIL
+scheduler = BackgroundScheduler(
+    executors={
+        'default': ThreadPoolExecutor(10),
+        CAMPAIGN_EXECUTOR: build_campaign_executor()
+    },
+    job_defaults={
+        'coalesce': True,
+        'max_instances': 1,
+        'misfire_grace_time': CAMPAIGN_MISFIRE_GRACE
+    }
+)
+scheduler.add_listener(log_campaign_event, CAMPAIGN_EVENTS)
+
+def campaign_job_options(schedule: ScheduleBase, job_id: str) -> dict:
+    """Common add_job arguments for a campaign run in the process pool."""
+    if not schedule.data_path:
+        raise ValueError("data_path is required to schedule a campaign")
+    pacing = schedule.pacing.model_dump() if schedule.pacing else None
+    # Reject a half-open window or non-positive rate now, not later inside the worker
+    DeliveryPacer.from_config(pacing)
+    return {
+        "func": run_campaign,
+        "args": (
+            job_id,
+            schedule.data_path,
+            schedule.template,
+            pacing
+        ),
+        "id": job_id,
+        "executor": CAMPAIGN_EXECUTOR,
+        "max_instances": schedule.max_instances,
+        "coalesce": schedule.coalesce,
+        "misfire_grace_time": schedule.misfire_grace_time or CAMPAIGN_MISFIRE_GRACE,
+        "replace_existing": True
+    }
+
+@app.on_event("startup")
+async def warm_up_heavy_imports():
+    start_warmup()
+
+@app.on_event("startup")
+async def start_outbox():
+    start_outbox_sender()
+    start_campaign_outbox_sender()
 
 def add_email_job(schedule_request: EmailScheduleRequest) -> ScheduleResponse:
     """Add a new email job to the scheduler based on schedule type."""
@@ -89,13 +160,13 @@ def add_email_job(schedule_request: EmailScheduleRequest) -> ScheduleResponse:
         job_id = schedule.job_id or f"email_job_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
 
         if schedule_request.schedule_type == "immediate":
-            # Run job immediately
-            process_supervisors()
+            # Run job immediately, still in the campaign process pool
+            job = scheduler.add_job(**campaign_job_options(schedule, job_id))
             return ScheduleResponse(
                 success=True,
-                message="Email sent immediately",
-                job_id=job_id,
-                next_run_time=datetime.now()
+                message="Email campaign started",
+                job_id=job.id,
+                next_run_time=job.next_run_time
             )
 
         elif schedule_request.schedule_type == "one_time":
@@ -104,9 +175,8 @@ def add_email_job(schedule_request: EmailScheduleRequest) -> ScheduleResponse:
                 
             # Schedule one-time job
             job = scheduler.add_job(
-                process_supervisors,
                 trigger=DateTrigger(run_date=schedule.schedule_time),
-                id=job_id
+                **campaign_job_options(schedule, job_id)
             )
             return ScheduleResponse(
                 success=True,
@@ -121,10 +191,9 @@ def add_email_job(schedule_request: EmailScheduleRequest) -> ScheduleResponse:
                 
             # Schedule recurring job
             job = scheduler.add_job(
-                process_supervisors,
                 trigger=CronTrigger.from_crontab(schedule.cron_expression),
-                id=job_id,
-                name=schedule.description or f"Recurring email job {job_id}"
+                name=schedule.description or f"Recurring email job {job_id}",
+                **campaign_job_options(schedule, job_id)
             )
             return ScheduleResponse(
                 success=True,
@@ -152,7 +221,11 @@ async def get_scheduled_jobs():
                 "job_id": job.id,
                 "name": job.name,
                 "next_run_time": job.next_run_time,
-                "trigger": str(job.trigger)
+                "trigger": str(job.trigger),
+                "executor": job.executor,
+                "max_instances": job.max_instances,
+                "coalesce": job.coalesce,
+                "misfire_grace_time": job.misfire_grace_time
             }
             for job in jobs
         ]
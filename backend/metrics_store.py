@@ -0,0 +1,206 @@
+"""
+Historical per-supervisor metrics in a local SQLite database.
+
+Every processed export is stored as one snapshot. Rows are indexed on
+(supervisor, snapshot_date) and on snapshot_date, so trend queries only read
+the matching index range and stay in the millisecond range even with years of
+weekly snapshots. Re-processing an export for the same date and source replaces
+that snapshot instead of duplicating it.
+"""
+import logging
+import os
+import sqlite3
+import threading
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+METRICS_DB_PATH = os.getenv('METRICS_DB_PATH', 'metrics_history.db')
+METRICS_HISTORY_ENABLED = os.getenv('METRICS_HISTORY_ENABLED', 'true').lower() == 'true'
+
+METRIC_FIELDS = ('total', 'completed', 'pending', 'past_due', 'completion_rate')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY,
+    snapshot_date TEXT NOT NULL,
+    source TEXT NOT NULL DEFAULT '',
+    created_at TEXT NOT NULL,
+    UNIQUE (snapshot_date, source)
+);
+CREATE TABLE IF NOT EXISTS supervisor_metrics (
+    snapshot_id INTEGER NOT NULL REFERENCES snapshots(id) ON DELETE CASCADE,
+    snapshot_date TEXT NOT NULL,
+    supervisor TEXT NOT NULL,
+    email TEXT,
+    total REAL NOT NULL,
+    completed REAL NOT NULL,
+    pending REAL NOT NULL,
+    past_due REAL NOT NULL,
+    completion_rate REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_metrics_supervisor_date ON supervisor_metrics (supervisor, snapshot_date);
+CREATE INDEX IF NOT EXISTS idx_metrics_email_date ON supervisor_metrics (email, snapshot_date);
+CREATE INDEX IF NOT EXISTS idx_metrics_date ON supervisor_metrics (snapshot_date);
+CREATE INDEX IF NOT EXISTS idx_metrics_snapshot ON supervisor_metrics (snapshot_id);
+"""
+
+
+def _since(weeks: Optional[int], until: Optional[date] = None) -> Optional[str]:
+    if not weeks:
+        return None
+    return ((until or date.today()) - timedelta(weeks=weeks)).isoformat()
+
+
+class MetricsStore:
+    """Append-only store of the metrics process_supervisors computes, one snapshot per export."""
+
+    def __init__(self, path: str = METRICS_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        # One connection per thread; the API serves requests from several threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA foreign_keys=ON')
+            self._local.conn = conn
+        return conn
+
+    def record_snapshot(
+        self,
+        metrics: Dict[str, Dict[str, float]],
+        emails: Optional[Dict[str, str]] = None,
+        snapshot_date: Optional[date] = None,
+        source: str = ''
+    ) -> int:
+        """Store one export's per-supervisor metrics and return the snapshot id."""
+        snapshot_date = (snapshot_date or date.today()).isoformat()
+        emails = emails or {}
+        conn = self._connect()
+        with conn:
+            conn.execute('DELETE FROM snapshots WHERE snapshot_date = ? AND source = ?', (snapshot_date, source))
+            cursor = conn.execute(
+                'INSERT INTO snapshots (snapshot_date, source, created_at) VALUES (?, ?, ?)',
+                (snapshot_date, source, datetime.now().isoformat(timespec='seconds'))
+            )
+            snapshot_id = cursor.lastrowid
+            conn.executemany(
+                'INSERT INTO supervisor_metrics (snapshot_id, snapshot_date, supervisor, email, '
+                'total, completed, pending, past_due, completion_rate) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (
+                    (snapshot_id, snapshot_date, supervisor, emails.get(supervisor),
+                     *(float(values[field]) for field in METRIC_FIELDS))
+                    for supervisor, values in metrics.items()
+                )
+            )
+        logger.info(f"Recorded metrics snapshot {snapshot_id} for {snapshot_date} ({len(metrics)} supervisors)")
+        return snapshot_id
+
+    def supervisor_trend(
+        self,
+        supervisor: Optional[str] = None,
+        email: Optional[str] = None,
+        weeks: Optional[int] = 12,
+        until: Optional[date] = None
+    ) -> List[Dict[str, object]]:
+        """Snapshots for one supervisor (by name or email address), oldest first."""
+        if not supervisor and not email:
+            raise ValueError("Either supervisor or email is required")
+        column, value = ('supervisor', supervisor) if supervisor else ('email', email)
+        query = f'SELECT snapshot_date, {", ".join(METRIC_FIELDS)} FROM supervisor_metrics WHERE {column} = ?'
+        params: List[object] = [value]
+        since = _since(weeks, until)
+        if since:
+            query += ' AND snapshot_date >= ?'
+            params.append(since)
+        if until:
+            query += ' AND snapshot_date <= ?'
+            params.append(until.isoformat())
+        query += ' ORDER BY snapshot_date'
+        return [dict(row) for row in self._connect().execute(query, params)]
+
+    def trends(
+        self,
+        supervisors: Iterable[str],
+        field: str = 'past_due',
+        weeks: Optional[int] = 12,
+        until: Optional[date] = None,
+        before: Optional[date] = None
+    ) -> Dict[str, List[float]]:
+        """
+        One metric over time for many supervisors at once, oldest first; used for chart trend lines.
+
+        The `weeks` range ends at `until` (inclusive) or `before` (exclusive, e.g. to
+        leave out the snapshot about to be recorded), or today if neither is given.
+        """
+        if field not in METRIC_FIELDS:
+            raise ValueError(f"Unknown metric: {field}")
+        wanted = set(supervisors)
+        query = f'SELECT supervisor, {field} FROM supervisor_metrics'
+        conditions: List[str] = []
+        params: List[object] = []
+        since = _since(weeks, until or before)
+        if since:
+            # Range scan on idx_metrics_date, then filter in Python rather than a huge IN list
+            conditions.append('snapshot_date >= ?')
+            params.append(since)
+        if until:
+            conditions.append('snapshot_date <= ?')
+            params.append(until.isoformat())
+        if before:
+            conditions.append('snapshot_date < ?')
+            params.append(before.isoformat())
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' ORDER BY snapshot_date'
+
+        history: Dict[str, List[float]] = {}
+        for supervisor, value in self._connect().execute(query, params):
+            if supervisor in wanted:
+                history.setdefault(supervisor, []).append(value)
+        return history
+
+    def totals(self, weeks: Optional[int] = 12) -> List[Dict[str, object]]:
+        """Organisation-wide sums per snapshot date, oldest first."""
+        query = (
+            'SELECT snapshot_date, COUNT(*) AS supervisors, SUM(total) AS total, SUM(completed) AS completed, '
+            'SUM(pending) AS pending, SUM(past_due) AS past_due FROM supervisor_metrics'
+        )
+        params: List[object] = []
+        since = _since(weeks)
+        if since:
+            query += ' WHERE snapshot_date >= ?'
+            params.append(since)
+        query += ' GROUP BY snapshot_date ORDER BY snapshot_date'
+        return [dict(row) for row in self._connect().execute(query, params)]
+
+    def list_supervisors(self) -> List[Dict[str, object]]:
+        """Every supervisor seen, with the number of snapshots and the latest snapshot date."""
+        query = (
+            'SELECT supervisor, MAX(email) AS email, COUNT(*) AS snapshots, MAX(snapshot_date) AS last_snapshot '
+            'FROM supervisor_metrics GROUP BY supervisor ORDER BY supervisor'
+        )
+        return [dict(row) for row in self._connect().execute(query)]
+
+
+_store: Optional[MetricsStore] = None
+_store_lock = threading.Lock()
+
+
+def get_metrics_store() -> Optional[MetricsStore]:
+    """Shared store at METRICS_DB_PATH, or None when METRICS_HISTORY_ENABLED=false."""
+    global _store
+    if not METRICS_HISTORY_ENABLED:
+        return None
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = MetricsStore(METRICS_DB_PATH)
+    return _store
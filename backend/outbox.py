@@ -0,0 +1,430 @@
+"""
+Maildir-style outbox spool that decouples rendering from SMTP delivery.
+
+Stage one (process_supervisors with an outbox) writes fully rendered messages into
+`new/`; stage two (OutboxSender) drains them at its own pace, delivering as many at once
+as the adaptive SMTP limit (smtp_concurrency) allows. A message is written
+to `tmp/` and atomically renamed into `new/`, and a sender claims it by renaming it
+into `cur/`, so several senders can share a spool and a crash never loses or
+half-sends a message. A claim is a lease: messages left in `cur/` for longer than
+OUTBOX_CLAIM_LEASE seconds (by a sender that crashed) go back to `new/`, while
+claims held by live senders are left alone.
+
+Failed deliveries are retried with exponential backoff: the time a message may
+next be tried is stored as its mtime in `new/`, so it survives restarts. When the
+relay itself is unavailable (connection errors, 421) the pass stops without
+charging the remaining messages an attempt. Permanently undeliverable messages
+end up in `failed/` and can be put back with requeue_failed() (POST
+/api/outbox/retry-failed or `--retry-failed`).
+
+Run a standalone sender with:
+    python -m backend.outbox --dir /path/to/outbox
+"""
+import argparse
+import email
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from email.message import Message
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .smtp_concurrency import AIMDController, smtp_controller, smtp_error_code
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_DIR = os.getenv('OUTBOX_DIR')
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '8'))
+OUTBOX_POLL_INTERVAL = float(os.getenv('OUTBOX_POLL_INTERVAL', '5'))
+# Seconds after which a claimed but unfinished message is considered abandoned; keep well above the SMTP timeout
+OUTBOX_CLAIM_LEASE = float(os.getenv('OUTBOX_CLAIM_LEASE', '600'))
+# Scheduled campaigns always spool here so their SMTP traffic goes through the API process's shared limit
+CAMPAIGN_OUTBOX_DIR = os.getenv('CAMPAIGN_OUTBOX_DIR') or OUTBOX_DIR or 'campaign_outbox'
+# Retry delay doubles per attempt from OUTBOX_RETRY_BASE up to OUTBOX_RETRY_MAX seconds
+OUTBOX_RETRY_BASE = float(os.getenv('OUTBOX_RETRY_BASE', '60'))
+OUTBOX_RETRY_MAX = float(os.getenv('OUTBOX_RETRY_MAX', '3600'))
+
+# Attempt counter is kept in the file name so it survives sender restarts
+ATTEMPT_SEPARATOR = '+'
+
+
+class Outbox:
+    """Spool directory with maildir `tmp/`, `new/` and `cur/` folders plus `failed/`."""
+
+    def __init__(self, root: str):
+        self.root = root
+        self.tmp_dir = os.path.join(root, 'tmp')
+        self.new_dir = os.path.join(root, 'new')
+        self.cur_dir = os.path.join(root, 'cur')
+        self.failed_dir = os.path.join(root, 'failed')
+        for directory in (self.tmp_dir, self.new_dir, self.cur_dir, self.failed_dir):
+            os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def _unique_name() -> str:
+        return f"{time.time():.6f}.{uuid.uuid4().hex}.{socket.gethostname()}"
+
+    @staticmethod
+    def attempts(name: str) -> int:
+        _, _, count = name.partition(ATTEMPT_SEPARATOR)
+        return int(count) if count.isdigit() else 0
+
+    def enqueue(self, msg: Message) -> str:
+        """Write a rendered message to the spool and return its name."""
+        name = self._unique_name()
+        tmp_path = os.path.join(self.tmp_dir, name)
+        with open(tmp_path, 'wb') as f:
+            f.write(msg.as_bytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, os.path.join(self.new_dir, name))
+        return name
+
+    def pending(self, now: Optional[float] = None) -> List[str]:
+        """Names in `new/` whose retry time has come, oldest first."""
+        now = time.time() if now is None else now
+        due = []
+        for name in sorted(os.listdir(self.new_dir)):
+            try:
+                if os.path.getmtime(os.path.join(self.new_dir, name)) <= now:
+                    due.append(name)
+            except FileNotFoundError:
+                continue
+        return due
+
+    def claim(self, name: str) -> Optional[str]:
+        """Move a message into `cur/`; returns None if another sender got it first."""
+        new_path = os.path.join(self.new_dir, name)
+        try:
+            # The mtime marks when the lease started; set it before the rename so recover() never sees a stale one
+            os.utime(new_path)
+            os.replace(new_path, os.path.join(self.cur_dir, name))
+            return os.path.join(self.cur_dir, name)
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def load(path: str) -> Message:
+        with open(path, 'rb') as f:
+            return email.message_from_binary_file(f)
+
+    def complete(self, name: str) -> None:
+        os.remove(os.path.join(self.cur_dir, name))
+
+    def release(self, name: str, delay: float = 0.0, count_attempt: bool = True) -> str:
+        """
+        Return a claimed message to `new/`, not to be tried again for `delay` seconds.
+
+        count_attempt=False puts it back without using up one of its attempts.
+        """
+        base = name.partition(ATTEMPT_SEPARATOR)[0]
+        attempts = self.attempts(name) + (1 if count_attempt else 0)
+        retry_name = f"{base}{ATTEMPT_SEPARATOR}{attempts}" if attempts else base
+        cur_path = os.path.join(self.cur_dir, name)
+        retry_at = time.time() + delay
+        os.utime(cur_path, (retry_at, retry_at))
+        os.replace(cur_path, os.path.join(self.new_dir, retry_name))
+        return retry_name
+
+    def fail(self, name: str) -> None:
+        os.replace(os.path.join(self.cur_dir, name), os.path.join(self.failed_dir, name))
+
+    def recover(self, lease: float = OUTBOX_CLAIM_LEASE) -> int:
+        """
+        Put messages whose claim is older than `lease` seconds back into `new/`.
+
+        Safe while other senders drain the same spool: their claims are younger than the lease.
+        """
+        cutoff = time.time() - lease
+        recovered = 0
+        for name in os.listdir(self.cur_dir):
+            try:
+                if os.path.getmtime(os.path.join(self.cur_dir, name)) > cutoff:
+                    continue
+                self.release(name)
+                recovered += 1
+            except FileNotFoundError:
+                # Completed, or recovered by another sender, in the meantime
+                continue
+        return recovered
+
+    def requeue_failed(self) -> int:
+        """Move everything in `failed/` back to `new/` with a fresh set of attempts."""
+        requeued = 0
+        for name in os.listdir(self.failed_dir):
+            base = name.partition(ATTEMPT_SEPARATOR)[0]
+            path = os.path.join(self.failed_dir, name)
+            try:
+                os.utime(path)
+                os.replace(path, os.path.join(self.new_dir, base))
+                requeued += 1
+            except FileNotFoundError:
+                continue
+        return requeued
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'pending': len(os.listdir(self.new_dir)),
+            'in_progress': len(os.listdir(self.cur_dir)),
+            'failed': len(os.listdir(self.failed_dir)),
+        }
+
+
+# Failure classes: the relay is unavailable, the message will never go through, or try this message later
+RELAY_FAILURE = 'relay'
+PERMANENT_FAILURE = 'permanent'
+TRANSIENT_FAILURE = 'transient'
+
+
+def classify_failure(error: Exception) -> str:
+    """Classify a delivery error by SMTP reply code (refused senders and recipients included)."""
+    code = smtp_error_code(error)
+    if code is None:
+        # smtplib errors without a reply code are connection problems (SMTPException is an OSError)
+        return RELAY_FAILURE if isinstance(error, OSError) else TRANSIENT_FAILURE
+    if code == 421:
+        return RELAY_FAILURE
+    return PERMANENT_FAILURE if code >= 500 else TRANSIENT_FAILURE
+
+
+def retry_delay(attempts: int, base: float = OUTBOX_RETRY_BASE, cap: float = OUTBOX_RETRY_MAX) -> float:
+    """Exponential backoff before attempt number `attempts + 1`."""
+    return min(cap, base * 2 ** max(attempts - 1, 0))
+
+
+class OutboxSender:
+    """Drains an Outbox in a background thread; can be paused, resumed and stopped."""
+
+    def __init__(
+        self,
+        outbox: Outbox,
+        deliver: Optional[Callable[[Message], None]] = None,
+        max_attempts: int = OUTBOX_MAX_ATTEMPTS,
+        poll_interval: float = OUTBOX_POLL_INTERVAL,
+        claim_lease: float = OUTBOX_CLAIM_LEASE,
+        controller: AIMDController = smtp_controller
+    ):
+        """`controller` bounds concurrent deliveries; deliver_message also holds one of its sessions per send."""
+        if deliver is None:
+            from .ge_automatic_email_tracking import deliver_message
+            deliver = deliver_message
+        self.outbox = outbox
+        self.deliver = deliver
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.claim_lease = claim_lease
+        self.controller = controller
+        self.sent = 0
+        self.failed = 0
+        self.relay_failures = 0
+        self._running = threading.Event()
+        self._running.set()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def paused(self) -> bool:
+        return not self._running.is_set()
+
+    def pause(self) -> None:
+        self._running.clear()
+        logger.info("Outbox sender paused")
+
+    def resume(self) -> None:
+        self._running.set()
+        logger.info("Outbox sender resumed")
+
+    def drain_once(self) -> Tuple[int, int]:
+        """
+        Try every due message once. Returns (sent, failed) for this pass.
+
+        Messages are delivered concurrently, as many at a time as the shared SMTP
+        controller currently allows. The pass stops at the first relay-level
+        failure; those messages go back without using an attempt.
+        """
+        sent = failed = 0
+        relay_down = False
+
+        def settle(done) -> None:
+            nonlocal sent, failed, relay_down
+            for future in done:
+                error = future.exception()
+                outcome = self._settle(in_flight.pop(future), error, None if error else future.result())
+                if outcome == 'sent':
+                    sent += 1
+                elif outcome == 'failed':
+                    failed += 1
+                elif outcome == RELAY_FAILURE:
+                    relay_down = True
+
+        with ThreadPoolExecutor(max_workers=self.controller.max_limit, thread_name_prefix='outbox-send') as pool:
+            in_flight: Dict[Future, str] = {}
+            for name in self.outbox.pending():
+                if self._stop.is_set() or self.paused or relay_down:
+                    break
+                # Only claim what can be sent now, so other senders can take the rest
+                while len(in_flight) >= max(1, int(self.controller.limit)):
+                    settle(wait(in_flight, return_when=FIRST_COMPLETED).done)
+                if relay_down:
+                    break
+                path = self.outbox.claim(name)
+                if path is not None:
+                    in_flight[pool.submit(self._deliver_claimed, path)] = name
+            settle(wait(in_flight).done)
+
+        self.sent += sent
+        self.failed += failed
+        return sent, failed
+
+    def _deliver_claimed(self, path: str) -> Optional[str]:
+        msg = self.outbox.load(path)
+        self.deliver(msg)
+        return msg['To']
+
+    def _settle(self, name: str, error: Optional[BaseException], recipient: Optional[str] = None) -> str:
+        """Move a finished message to its next place and return what happened to it."""
+        if error is None:
+            self.outbox.complete(name)
+            self.relay_failures = 0
+            logger.info(f"Outbox delivered {name} to {recipient}")
+            return 'sent'
+        kind = classify_failure(error)
+        attempts = self.outbox.attempts(name) + 1
+        if kind == RELAY_FAILURE:
+            self.outbox.release(name, count_attempt=False)
+            self.relay_failures += 1
+            logger.warning(f"Outbox pausing this pass, relay unavailable: {str(error)}")
+            return RELAY_FAILURE
+        if kind == PERMANENT_FAILURE or attempts >= self.max_attempts:
+            self.outbox.fail(name)
+            logger.error(f"Outbox giving up on {name}: {str(error)}")
+            return 'failed'
+        delay = retry_delay(attempts)
+        self.outbox.release(name, delay)
+        logger.warning(f"Outbox delivery of {name} failed, retrying in {delay:.0f}s: {str(error)}")
+        return 'retry'
+
+    def next_pass_delay(self) -> float:
+        """Poll interval, or exponential backoff while the relay keeps failing."""
+        if self.relay_failures:
+            return max(self.poll_interval, retry_delay(self.relay_failures, base=self.poll_interval))
+        return self.poll_interval
+
+    def recover_abandoned(self) -> int:
+        recovered = self.outbox.recover(self.claim_lease)
+        if recovered:
+            logger.info(f"Outbox recovered {recovered} interrupted messages")
+        return recovered
+
+    def run(self) -> None:
+        while not self._stop.is_set():
+            if self._running.wait(timeout=self.poll_interval) and not self._stop.is_set():
+                # Checked every pass, so a crashed peer's claims come back without restarting anything
+                self.recover_abandoned()
+                self.drain_once()
+                self._stop.wait(self.next_pass_delay())
+
+    def start(self) -> threading.Thread:
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run, name='outbox-sender', daemon=True)
+            self._thread.start()
+        return self._thread
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stop.set()
+        self._running.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def status(self) -> Dict[str, object]:
+        return {
+            **self.outbox.stats(),
+            'paused': self.paused,
+            'running': self._thread is not None and self._thread.is_alive(),
+            'sent': self.sent,
+            'failed_total': self.failed,
+            'relay_failures': self.relay_failures,
+        }
+
+
+outbox: Optional[Outbox] = Outbox(OUTBOX_DIR) if OUTBOX_DIR else None
+outbox_sender: Optional[OutboxSender] = OutboxSender(outbox) if outbox else None
+
+
+campaign_outbox_sender: Optional[OutboxSender] = None
+
+
+def in_process_sender_enabled() -> bool:
+    return os.getenv('OUTBOX_SENDER', 'true').lower() == 'true'
+
+
+def start_outbox_sender() -> None:
+    """Start the in-process sender unless OUTBOX_SENDER=false (e.g. a standalone sender drains the spool)."""
+    if outbox_sender is not None and in_process_sender_enabled():
+        outbox_sender.start()
+        logger.info(f"Outbox sender started for {outbox.root}")
+
+
+def get_campaign_outbox() -> Outbox:
+    """Spool campaign workers write to; the main outbox when it is the same directory."""
+    if outbox is not None and outbox.root == CAMPAIGN_OUTBOX_DIR:
+        return outbox
+    return Outbox(CAMPAIGN_OUTBOX_DIR)
+
+
+def start_campaign_outbox_sender() -> None:
+    """
+    Drain the campaign spool from the scheduler's process.
+
+    Campaign workers are separate processes with their own smtp_controller, so they
+    only spool; delivery happens here, under the same adaptive limit as everything else.
+    """
+    global campaign_outbox_sender
+    campaign_outbox = get_campaign_outbox()
+    if campaign_outbox is outbox:
+        start_outbox_sender()
+        return
+    if in_process_sender_enabled():
+        if campaign_outbox_sender is None:
+            campaign_outbox_sender = OutboxSender(campaign_outbox)
+        campaign_outbox_sender.start()
+        logger.info(f"Campaign outbox sender started for {campaign_outbox.root}")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Drain the outbox spool over SMTP.")
+    parser.add_argument('--dir', default=OUTBOX_DIR, required=OUTBOX_DIR is None, help='outbox directory')
+    parser.add_argument('--once', action='store_true', help='drain the current backlog once and exit')
+    parser.add_argument('--retry-failed', action='store_true', help='move failed messages back into the queue first')
+    parser.add_argument('--max-attempts', type=int, default=OUTBOX_MAX_ATTEMPTS)
+    parser.add_argument('--poll-interval', type=float, default=OUTBOX_POLL_INTERVAL)
+    parser.add_argument('--claim-lease', type=float, default=OUTBOX_CLAIM_LEASE,
+                        help='seconds before an unfinished claim is treated as abandoned')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    sender = OutboxSender(
+        Outbox(args.dir),
+        max_attempts=args.max_attempts,
+        poll_interval=args.poll_interval,
+        claim_lease=args.claim_lease
+    )
+    if args.retry_failed:
+        print(f"Requeued {sender.outbox.requeue_failed()} failed messages")
+    if args.once:
+        sender.recover_abandoned()
+        sent, failed = sender.drain_once()
+        print(f"Delivered {sent}, failed {failed}")
+        return
+    try:
+        sender.run()
+    except KeyboardInterrupt:
+        print("Outbox sender stopped by user.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Paced delivery: spread a campaign's sends evenly over a delivery window.
+
+A campaign can declare a window (e.g. 08:00-10:00 local time) and/or a maximum
+rate. DeliveryPacer turns that into evenly spaced send slots. It waits for the
+window to open and then keeps the send rate under both the window pace and the
+rate cap, so the relay never sees the whole campaign as one spike.
+"""
+import logging
+import time
+from datetime import datetime, timedelta
+from datetime import time as time_of_day
+from typing import Callable, Dict, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_time(value: Union[str, time_of_day, None]) -> Optional[time_of_day]:
+    if value is None or isinstance(value, time_of_day):
+        return value
+    return time_of_day.fromisoformat(value)
+
+
+class DeliveryPacer:
+    """Hands out evenly spaced send slots; call plan() once, then wait_turn() before every send."""
+
+    def __init__(
+        self,
+        window_start: Union[str, time_of_day, None] = None,
+        window_end: Union[str, time_of_day, None] = None,
+        max_per_minute: Optional[float] = None,
+        now: Callable[[], datetime] = datetime.now,
+        sleep: Callable[[float], None] = time.sleep,
+        monotonic: Callable[[], float] = time.monotonic
+    ):
+        self.window_start = _parse_time(window_start)
+        self.window_end = _parse_time(window_end)
+        if (self.window_start is None) != (self.window_end is None):
+            raise ValueError("Delivery window needs both a start and an end time")
+        if max_per_minute is not None and max_per_minute <= 0:
+            raise ValueError("max_per_minute must be positive")
+        self.max_per_minute = max_per_minute
+        self._now = now
+        self._sleep = sleep
+        self._monotonic = monotonic
+        self.interval = 0.0
+        self._next_slot: Optional[float] = None
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict[str, object]]) -> Optional['DeliveryPacer']:
+        """Build a pacer from a schedule's pacing settings; None when nothing is configured."""
+        if not config or all(config.get(key) is None for key in ('window_start', 'window_end', 'max_per_minute')):
+            return None
+        return cls(config.get('window_start'), config.get('window_end'), config.get('max_per_minute'))
+
+    def window_bounds(self, now: datetime) -> Optional[tuple]:
+        """The next (or current) window as datetimes; windows may cross midnight."""
+        if self.window_start is None:
+            return None
+        start = datetime.combine(now.date(), self.window_start)
+        end = datetime.combine(now.date(), self.window_end)
+        if end <= start:
+            end += timedelta(days=1)
+        if end - timedelta(days=1) > now:
+            # Still inside yesterday's overnight window
+            start, end = start - timedelta(days=1), end - timedelta(days=1)
+        elif now >= end:
+            # Today's window has closed (late or one-off fire): wait for tomorrow's
+            start, end = start + timedelta(days=1), end + timedelta(days=1)
+        return start, end
+
+    def plan(self, total: int) -> None:
+        """Work out the first slot and spacing for `total` sends."""
+        now = self._now()
+        delay = 0.0
+        interval = 0.0
+        bounds = self.window_bounds(now)
+        if bounds is not None:
+            start, end = bounds
+            begin = max(now, start)
+            delay = (begin - now).total_seconds()
+            interval = (end - begin).total_seconds() / max(total, 1)
+        if self.max_per_minute:
+            interval = max(interval, 60.0 / self.max_per_minute)
+
+        self.interval = interval
+        self._next_slot = self._monotonic() + delay
+        logger.info(f"Pacing {total} emails: first in {delay:.0f}s, then one every {interval:.2f}s")
+
+    def wait_turn(self) -> None:
+        """Block until the next send slot."""
+        if self._next_slot is None:
+            self.plan(1)
+        remaining = self._next_slot - self._monotonic()
+        if remaining > 0:
+            self._sleep(remaining)
+        # Schedule from the planned slot, not from now, so slow sends do not stretch the campaign
+        self._next_slot = max(self._next_slot, self._monotonic() - self.interval) + self.interval
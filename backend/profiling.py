@@ -0,0 +1,250 @@
+"""
+Opt-in request profiling for the FastAPI apps.
+
+When PROFILING_ENABLED=true, a request is profiled if it carries the
+`X-Profile: 1` header together with a valid `X-API-Key`, or is picked by
+PROFILING_SAMPLE_RATE. Each profiled request
+stores, under PROFILING_DIR:
+- `<id>.prof`  cProfile stats (open with snakeviz / pstats), or `<id>.html` with pyinstrument
+- `<id>.txt`   readable call summary
+- `<id>.json`  request details and the top tracemalloc allocation sites
+
+Profiles are listed and downloaded through the /api/admin/profiles endpoints.
+Only one request is profiled at a time because cProfile and tracemalloc are
+process-wide; requests arriving meanwhile run unprofiled, but their event-loop
+work still lands in the cProfile stats. The `.json` records how many other
+requests overlapped (`concurrent_requests`) so such profiles can be discounted.
+The middleware is only installed when PROFILING_ENABLED=true, so it costs nothing
+otherwise.
+
+The call profile only covers the event-loop thread and only until the response
+object is returned. Work on other threads (SMTP sends on the `smtp-send` pool,
+asyncio.to_thread calls, the outbox sender) shows up as the time spent waiting
+for it, e.g. in `futures.wait`, and streamed bodies such as /api/export-emails
+are rendered after the profile ends. tracemalloc does cover every thread. Use
+/api/smtp/status or the load test to look at SMTP time.
+"""
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import random
+import re
+import secrets
+import threading
+import time
+import tracemalloc
+import uuid
+from typing import Callable, Dict, List, Optional
+
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+
+logger = logging.getLogger(__name__)
+
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'false').lower() == 'true'
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', '0'))
+PROFILING_DIR = os.getenv('PROFILING_DIR', 'profiles')
+PROFILING_KEEP = int(os.getenv('PROFILING_KEEP', '50'))
+# "cprofile" (default) or "pyinstrument" if that package is installed
+PROFILING_ENGINE = os.getenv('PROFILING_ENGINE', 'cprofile').lower()
+PROFILE_HEADER = 'X-Profile'
+API_KEY_HEADER = 'X-API-Key'
+TOP_ALLOCATIONS = 25
+
+PROFILE_ID_PATTERN = re.compile(r'^[A-Za-z0-9_.-]+$')
+ARTIFACT_EXTENSIONS = ('prof', 'html', 'txt', 'json')
+
+_profile_lock = threading.Lock()
+
+
+def _new_profile_id(request: Request) -> str:
+    slug = re.sub(r'[^A-Za-z0-9]+', '-', request.url.path).strip('-') or 'root'
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{request.method.lower()}-{slug}-{uuid.uuid4().hex[:8]}"
+
+
+def _load_pyinstrument():
+    try:
+        from pyinstrument import Profiler
+        return Profiler
+    except ImportError:
+        logger.warning("PROFILING_ENGINE=pyinstrument but pyinstrument is not installed; using cProfile")
+        return None
+
+
+class ProfilingMiddleware(BaseHTTPMiddleware):
+    """Capture a call profile and allocation snapshot for sampled or flagged requests."""
+
+    def __init__(
+        self,
+        app,
+        enabled: bool = PROFILING_ENABLED,
+        sample_rate: float = PROFILING_SAMPLE_RATE,
+        profile_dir: str = PROFILING_DIR,
+        keep: int = PROFILING_KEEP,
+        engine: str = PROFILING_ENGINE,
+        api_key: Callable[[], Optional[str]] = lambda: None
+    ):
+        """`api_key` returns the key a client must send to force profiling with the header."""
+        super().__init__(app)
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.profile_dir = profile_dir
+        self.keep = keep
+        self.api_key = api_key
+        self._in_flight = 0
+        self._overlap = 0
+        self._profiling = False
+        self.pyinstrument = _load_pyinstrument() if engine == 'pyinstrument' else None
+
+    def should_profile(self, request: Request) -> bool:
+        if not self.enabled or not request.url.path.startswith('/api/') or request.url.path.startswith('/api/admin/'):
+            return False
+        if request.headers.get(PROFILE_HEADER, '').lower() in ('1', 'true', 'yes'):
+            if self.is_authorised(request):
+                return True
+            logger.warning(f"Ignoring {PROFILE_HEADER} without a valid API key on {request.url.path}")
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def is_authorised(self, request: Request) -> bool:
+        expected = self.api_key()
+        supplied = request.headers.get(API_KEY_HEADER)
+        return bool(expected and supplied) and secrets.compare_digest(supplied, expected)
+
+    async def dispatch(self, request: Request, call_next):
+        # All dispatches run on the event-loop thread, so plain counters are safe
+        self._in_flight += 1
+        if self._profiling:
+            self._overlap = max(self._overlap, self._in_flight - 1)
+        try:
+            return await self._dispatch(request, call_next)
+        finally:
+            self._in_flight -= 1
+
+    async def _dispatch(self, request: Request, call_next):
+        if not self.should_profile(request) or not _profile_lock.acquire(blocking=False):
+            return await call_next(request)
+
+        profile_id = _new_profile_id(request)
+        started_tracing = not tracemalloc.is_tracing()
+        try:
+            if started_tracing:
+                tracemalloc.start(10)
+            tracemalloc.reset_peak()
+            self._profiling = True
+            self._overlap = self._in_flight - 1
+            if self.pyinstrument:
+                profiler = self.pyinstrument(async_mode='enabled')
+                profiler.start()
+            else:
+                profiler = cProfile.Profile()
+                profiler.enable()
+
+            started = time.perf_counter()
+            status_code = 500
+            try:
+                response = await call_next(request)
+                status_code = response.status_code
+            finally:
+                duration = time.perf_counter() - started
+                if self.pyinstrument:
+                    profiler.stop()
+                else:
+                    profiler.disable()
+                self._profiling = False
+                snapshot = tracemalloc.take_snapshot()
+                _, peak = tracemalloc.get_traced_memory()
+                self._save(profile_id, request, status_code, duration, profiler, snapshot, peak, self._overlap)
+
+            response.headers['X-Profile-Id'] = profile_id
+            return response
+        finally:
+            if started_tracing:
+                tracemalloc.stop()
+            _profile_lock.release()
+
+    def _save(self, profile_id, request, status_code, duration, profiler, snapshot, peak, overlap) -> None:
+        try:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            base = os.path.join(self.profile_dir, profile_id)
+
+            if self.pyinstrument:
+                with open(f"{base}.html", 'w', encoding='utf-8') as f:
+                    f.write(profiler.output_html())
+                summary = profiler.output_text(unicode=False, color=False)
+            else:
+                profiler.dump_stats(f"{base}.prof")
+                buffer = io.StringIO()
+                pstats.Stats(profiler, stream=buffer).sort_stats('cumulative').print_stats(50)
+                summary = buffer.getvalue()
+            with open(f"{base}.txt", 'w', encoding='utf-8') as f:
+                f.write(summary)
+
+            snapshot = snapshot.filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+            ))
+            allocations = [
+                {'location': str(stat.traceback[0]), 'size_kib': round(stat.size / 1024, 1), 'count': stat.count}
+                for stat in snapshot.statistics('lineno')[:TOP_ALLOCATIONS]
+            ]
+            meta = {
+                'id': profile_id,
+                'method': request.method,
+                'path': request.url.path,
+                'status_code': status_code,
+                'duration_ms': round(duration * 1000, 2),
+                'peak_traced_kib': round(peak / 1024, 1),
+                'engine': 'pyinstrument' if self.pyinstrument else 'cprofile',
+                'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'concurrent_requests': overlap,
+                'top_allocations': allocations,
+            }
+            if overlap:
+                # cProfile and tracemalloc see the whole process; pyinstrument's async mode only this request's task
+                included = 'allocations are' if self.pyinstrument else 'event-loop work and allocations are'
+                meta['note'] = f"{overlap} other request(s) ran during this profile; their {included} included"
+            with open(f"{base}.json", 'w', encoding='utf-8') as f:
+                json.dump(meta, f, indent=2)
+
+            logger.info(f"Saved profile {profile_id} ({meta['duration_ms']} ms) for {request.method} {request.url.path}")
+            prune_profiles(self.profile_dir, self.keep)
+        except Exception as e:
+            logger.error(f"Failed to save profile {profile_id}: {str(e)}")
+
+
+def prune_profiles(profile_dir: str = PROFILING_DIR, keep: int = PROFILING_KEEP) -> None:
+    """Delete all but the newest `keep` profiles."""
+    for meta in list_profiles(profile_dir)[keep:]:
+        for extension in ARTIFACT_EXTENSIONS:
+            path = os.path.join(profile_dir, f"{meta['id']}.{extension}")
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def list_profiles(profile_dir: str = PROFILING_DIR) -> List[Dict[str, object]]:
+    """Stored profile metadata, newest first."""
+    if not os.path.isdir(profile_dir):
+        return []
+    profiles = []
+    for name in os.listdir(profile_dir):
+        if not name.endswith('.json'):
+            continue
+        with open(os.path.join(profile_dir, name), encoding='utf-8') as f:
+            meta = json.load(f)
+        meta['artifacts'] = [
+            extension for extension in ARTIFACT_EXTENSIONS
+            if os.path.exists(os.path.join(profile_dir, f"{meta['id']}.{extension}"))
+        ]
+        profiles.append(meta)
+    return sorted(profiles, key=lambda meta: (meta['created_at'], meta['id']), reverse=True)
+
+
+def profile_artifact_path(profile_id: str, extension: str, profile_dir: str = PROFILING_DIR) -> Optional[str]:
+    """Path of a stored artifact, or None for unknown ids/extensions (also blocks path traversal)."""
+    if extension not in ARTIFACT_EXTENSIONS or not PROFILE_ID_PATTERN.match(profile_id):
+        return None
+    path = os.path.join(profile_dir, f"{profile_id}.{extension}")
+    return path if os.path.exists(path) else None
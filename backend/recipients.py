@@ -0,0 +1,249 @@
+"""
+Recipient resolution: SSO IDs to email addresses through a pluggable directory.
+
+Lookups are batched per campaign and cached with a TTL. Unknown or inactive SSO
+IDs are cached too (negative caching, with a shorter TTL), so bad recipients are
+dropped before sending instead of costing an SMTP round-trip and retries each
+time.
+
+Configure the directory with RECIPIENT_DIRECTORY:
+- `synthetic` (default): `<sso>@geaerospace.com`, the historical behaviour
+- `csv:/path/to/directory.csv`: columns `sso_id,email[,active]`, reloaded when the file changes
+- `ldap://host` or `ldaps://host`: needs ldap3 and LDAP_BASE_DN (plus LDAP_BIND_DN /
+  LDAP_BIND_PASSWORD, LDAP_SSO_ATTRIBUTE, LDAP_MAIL_ATTRIBUTE as required)
+"""
+import csv
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+RECIPIENT_DIRECTORY = os.getenv('RECIPIENT_DIRECTORY', 'synthetic')
+RECIPIENT_CACHE_TTL = float(os.getenv('RECIPIENT_CACHE_TTL', '86400'))
+RECIPIENT_NEGATIVE_TTL = float(os.getenv('RECIPIENT_NEGATIVE_TTL', '3600'))
+RECIPIENT_CACHE_SIZE = int(os.getenv('RECIPIENT_CACHE_SIZE', '200000'))
+
+EMAIL_DOMAIN = 'geaerospace.com'
+INACTIVE_VALUES = {'0', 'false', 'no', 'n', 'inactive', 'departed'}
+
+
+class RecipientDirectory:
+    """Backend interface: resolve a batch of SSO IDs in one call."""
+
+    name = 'base'
+
+    def lookup(self, sso_ids: List[str]) -> Dict[str, Optional[str]]:
+        """Map every requested SSO ID to an address, or to None if unknown or inactive."""
+        raise NotImplementedError
+
+
+class SyntheticDirectory(RecipientDirectory):
+    """Builds `<sso>@domain` without checking the ID exists; only malformed IDs are rejected."""
+
+    name = 'synthetic'
+    VALID_SSO = re.compile(r'^[A-Za-z0-9._-]+$')
+
+    def __init__(self, domain: str = EMAIL_DOMAIN):
+        self.domain = domain
+
+    def lookup(self, sso_ids: List[str]) -> Dict[str, Optional[str]]:
+        return {sso: f"{sso}@{self.domain}" if self.VALID_SSO.match(sso) else None for sso in sso_ids}
+
+
+class CsvDirectory(RecipientDirectory):
+    """Directory export (or local stand-in) as CSV with sso_id, email and optional active columns."""
+
+    name = 'csv'
+
+    def __init__(self, path: str):
+        self.path = path
+        self._entries: Dict[str, Optional[str]] = {}
+        self._mtime: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> None:
+        mtime = os.path.getmtime(self.path)
+        if mtime == self._mtime:
+            return
+        entries = {}
+        with open(self.path, newline='', encoding='utf-8-sig') as f:
+            for row in csv.DictReader(f):
+                sso = (row.get('sso_id') or '').strip()
+                if not sso:
+                    continue
+                email = (row.get('email') or '').strip() or None
+                active = (row.get('active') or 'true').strip().lower() not in INACTIVE_VALUES
+                entries[sso] = email if active else None
+        self._entries, self._mtime = entries, mtime
+        logger.info(f"Loaded {len(entries)} directory entries from {self.path}")
+
+    def lookup(self, sso_ids: List[str]) -> Dict[str, Optional[str]]:
+        with self._lock:
+            self._load()
+            return {sso: self._entries.get(sso) for sso in sso_ids}
+
+
+class LdapDirectory(RecipientDirectory):
+    """Batch lookups against LDAP/Active Directory with one OR filter per chunk of IDs."""
+
+    name = 'ldap'
+    CHUNK_SIZE = 100
+
+    def __init__(
+        self,
+        url: str,
+        base_dn: str,
+        bind_dn: Optional[str] = None,
+        password: Optional[str] = None,
+        sso_attribute: str = 'employeeID',
+        mail_attribute: str = 'mail'
+    ):
+        try:
+            import ldap3
+        except ImportError:
+            raise RuntimeError("ldap3 must be installed for LDAP recipient lookups")
+        self._ldap3 = ldap3
+        self.server = ldap3.Server(url, get_info=ldap3.NONE)
+        self.base_dn = base_dn
+        self.bind_dn = bind_dn
+        self.password = password
+        self.sso_attribute = sso_attribute
+        self.mail_attribute = mail_attribute
+
+    def lookup(self, sso_ids: List[str]) -> Dict[str, Optional[str]]:
+        from ldap3.utils.conv import escape_filter_chars
+
+        found: Dict[str, Optional[str]] = {sso: None for sso in sso_ids}
+        with self._ldap3.Connection(self.server, self.bind_dn, self.password, auto_bind=True, read_only=True) as conn:
+            for start in range(0, len(sso_ids), self.CHUNK_SIZE):
+                chunk = sso_ids[start:start + self.CHUNK_SIZE]
+                terms = ''.join(f"({self.sso_attribute}={escape_filter_chars(sso)})" for sso in chunk)
+                conn.search(
+                    self.base_dn,
+                    f"(|{terms})",
+                    attributes=[self.sso_attribute, self.mail_attribute],
+                    size_limit=len(chunk)
+                )
+                for entry in conn.entries:
+                    sso = str(entry[self.sso_attribute].value)
+                    mail = entry[self.mail_attribute].value
+                    if sso in found and mail:
+                        found[sso] = str(mail)
+        return found
+
+
+class RecipientResolver:
+    """TTL cache with negative caching in front of a RecipientDirectory."""
+
+    def __init__(
+        self,
+        directory: RecipientDirectory,
+        ttl: float = RECIPIENT_CACHE_TTL,
+        negative_ttl: float = RECIPIENT_NEGATIVE_TTL,
+        max_entries: int = RECIPIENT_CACHE_SIZE
+    ):
+        self.directory = directory
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._cache: "OrderedDict[str, Tuple[Optional[str], float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.lookups = 0
+
+    def resolve_many(self, sso_ids: Iterable[str]) -> Dict[str, Optional[str]]:
+        """Addresses for all IDs; cache misses go to the directory in a single batch."""
+        now = time.monotonic()
+        resolved: Dict[str, Optional[str]] = {}
+        missing: List[str] = []
+        with self._lock:
+            for sso in dict.fromkeys(sso_ids):
+                cached = self._cache.get(sso)
+                if cached is not None and cached[1] > now:
+                    self._cache.move_to_end(sso)
+                    resolved[sso] = cached[0]
+                    if cached[0] is None:
+                        self.negative_hits += 1
+                    else:
+                        self.hits += 1
+                else:
+                    missing.append(sso)
+            self.misses += len(missing)
+
+        if missing:
+            # Directory errors propagate and nothing is cached, so a flaky backend is retried next time
+            found = self.directory.lookup(missing)
+            with self._lock:
+                self.lookups += 1
+                for sso in missing:
+                    address = found.get(sso)
+                    self._cache[sso] = (address, now + (self.ttl if address else self.negative_ttl))
+                    self._cache.move_to_end(sso)
+                    resolved[sso] = address
+                while len(self._cache) > self.max_entries:
+                    self._cache.popitem(last=False)
+
+        unresolved = sum(1 for address in resolved.values() if address is None)
+        if unresolved:
+            logger.warning(f"{unresolved} of {len(resolved)} SSO IDs not found in {self.directory.name} directory")
+        return resolved
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+    def status(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                'directory': self.directory.name,
+                'cached': len(self._cache),
+                'cached_negative': sum(1 for address, _ in self._cache.values() if address is None),
+                'hits': self.hits,
+                'negative_hits': self.negative_hits,
+                'misses': self.misses,
+                'directory_lookups': self.lookups,
+                'ttl_s': self.ttl,
+                'negative_ttl_s': self.negative_ttl,
+            }
+
+
+def build_directory(spec: str = RECIPIENT_DIRECTORY) -> RecipientDirectory:
+    """Create the directory backend named by RECIPIENT_DIRECTORY."""
+    if spec == 'synthetic':
+        return SyntheticDirectory()
+    if spec.startswith('csv:'):
+        return CsvDirectory(spec[len('csv:'):])
+    if spec.startswith(('ldap://', 'ldaps://')):
+        base_dn = os.getenv('LDAP_BASE_DN')
+        if not base_dn:
+            raise ValueError("LDAP_BASE_DN must be set for LDAP recipient lookups")
+        return LdapDirectory(
+            spec,
+            base_dn,
+            os.getenv('LDAP_BIND_DN'),
+            os.getenv('LDAP_BIND_PASSWORD'),
+            os.getenv('LDAP_SSO_ATTRIBUTE', 'employeeID'),
+            os.getenv('LDAP_MAIL_ATTRIBUTE', 'mail')
+        )
+    raise ValueError(f"Unknown RECIPIENT_DIRECTORY: {spec}")
+
+
+_resolver: Optional[RecipientResolver] = None
+_resolver_lock = threading.Lock()
+
+
+def get_recipient_resolver() -> RecipientResolver:
+    """Process-wide resolver, so the cache is shared by every campaign in this process."""
+    global _resolver
+    if _resolver is None:
+        with _resolver_lock:
+            if _resolver is None:
+                _resolver = RecipientResolver(build_directory())
+    return _resolver
@@ -0,0 +1,192 @@
+"""
+Adaptive (AIMD) concurrency control for SMTP sessions.
+
+The number of SMTP sessions allowed in flight grows additively (+1 per window of
+healthy sends, like TCP congestion avoidance) while latency stays near its
+baseline. It is cut multiplicatively when the relay pushes back with 421/45x
+replies, drops connections, or latency rises well above the baseline. At most
+one cut is made per latency period, so a burst of failures from one congestion
+event counts once.
+
+The baseline is the fastest session seen over the last few minutes (like TCP
+Vegas/BBR's minimum RTT), so messages that are simply large and slow to upload
+do not read as congestion; only latency rising relative to that does.
+"""
+import logging
+import os
+import smtplib
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SMTP_MIN_CONCURRENCY = int(os.getenv('SMTP_MIN_CONCURRENCY', '1'))
+SMTP_MAX_CONCURRENCY = int(os.getenv('SMTP_MAX_CONCURRENCY', '8'))
+SMTP_INITIAL_CONCURRENCY = int(os.getenv('SMTP_INITIAL_CONCURRENCY', '2'))
+# Latency above baseline * tolerance is treated as the relay struggling
+SMTP_LATENCY_TOLERANCE = float(os.getenv('SMTP_LATENCY_TOLERANCE', '2.0'))
+# Optional absolute ceiling in seconds per session; 0 disables it
+SMTP_LATENCY_TARGET = float(os.getenv('SMTP_LATENCY_TARGET', '0'))
+# Seconds of history the latency baseline is taken over
+SMTP_BASELINE_WINDOW = float(os.getenv('SMTP_BASELINE_WINDOW', '300'))
+# Sessions needed before latency can trigger a cut
+BASELINE_MIN_SAMPLES = 5
+
+# Transient "try again later" replies used by relays to throttle senders
+THROTTLE_CODES = {421, 450, 451, 452}
+RATE_WINDOW_SECONDS = 60
+
+
+def smtp_error_code(error: BaseException) -> Optional[int]:
+    """Best-effort SMTP reply code carried by an smtplib exception."""
+    if isinstance(error, smtplib.SMTPResponseException):
+        return error.smtp_code
+    if isinstance(error, smtplib.SMTPRecipientsRefused) and error.recipients:
+        return next(iter(error.recipients.values()))[0]
+    return None
+
+
+class AIMDController:
+    """Limits in-flight SMTP sessions and adapts the limit to observed latency and replies."""
+
+    def __init__(
+        self,
+        min_limit: int = SMTP_MIN_CONCURRENCY,
+        max_limit: int = SMTP_MAX_CONCURRENCY,
+        initial_limit: int = SMTP_INITIAL_CONCURRENCY,
+        latency_tolerance: float = SMTP_LATENCY_TOLERANCE,
+        latency_target: float = SMTP_LATENCY_TARGET,
+        baseline_window: float = SMTP_BASELINE_WINDOW,
+        decrease_factor: float = 0.5,
+        smoothing: float = 0.2
+    ):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial_limit, self.min_limit), self.max_limit))
+        self.latency_tolerance = latency_tolerance
+        self.latency_target = latency_target
+        self.baseline_window = baseline_window
+        self.decrease_factor = decrease_factor
+        self.smoothing = smoothing
+        self.in_flight = 0
+        self.latency_ewma: Optional[float] = None
+        self.sent = 0
+        self.throttled = 0
+        self.errors = 0
+        self.last_decrease_reason: Optional[str] = None
+        self._last_decrease: Optional[float] = None
+        self._completions: Deque[float] = deque()
+        # Monotonic deque of (time, latency): increasing latencies, so the head is the window minimum
+        self._baseline: Deque[Tuple[float, float]] = deque()
+        self._samples = 0
+        self._condition = threading.Condition()
+
+    def acquire(self) -> None:
+        """Block until another session fits under the current limit."""
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self, latency: float, code: Optional[int] = None, failed: bool = False) -> None:
+        """Record the outcome of one session and adjust the limit."""
+        with self._condition:
+            self.in_flight -= 1
+            now = time.monotonic()
+            self.latency_ewma = latency if self.latency_ewma is None else (
+                self.smoothing * latency + (1 - self.smoothing) * self.latency_ewma
+            )
+            if not failed:
+                self._observe_baseline(now, latency)
+
+            if not failed:
+                self.sent += 1
+                self._completions.append(now)
+            elif code in THROTTLE_CODES:
+                self.throttled += 1
+            else:
+                self.errors += 1
+
+            if code in THROTTLE_CODES:
+                self._decrease(now, f"SMTP {code}")
+            elif failed and code is None:
+                # Dropped connections and timeouts are the other way a relay sheds load
+                self._decrease(now, "connection error")
+            elif self._latency_too_high():
+                self._decrease(now, f"latency {self.latency_ewma:.2f}s vs baseline {self.baseline:.2f}s")
+            elif not failed:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            # Permanent rejections (5xx) say nothing about relay capacity and leave the limit alone
+
+            while self._completions and now - self._completions[0] > RATE_WINDOW_SECONDS:
+                self._completions.popleft()
+            self._condition.notify_all()
+
+    def _observe_baseline(self, now: float, latency: float) -> None:
+        self._samples += 1
+        while self._baseline and self._baseline[-1][1] >= latency:
+            self._baseline.pop()
+        self._baseline.append((now, latency))
+        while self._baseline[0][0] < now - self.baseline_window:
+            self._baseline.popleft()
+
+    @property
+    def baseline(self) -> Optional[float]:
+        """Fastest healthy session in the baseline window."""
+        return self._baseline[0][1] if self._baseline else None
+
+    def _latency_too_high(self) -> bool:
+        if self.latency_target and self.latency_ewma > self.latency_target:
+            return True
+        if self._samples < BASELINE_MIN_SAMPLES or self.baseline is None:
+            return False
+        return self.latency_ewma > self.baseline * self.latency_tolerance
+
+    def _decrease(self, now: float, reason: str) -> None:
+        # One cut per latency period (at least a second): sessions already in flight failing together are one event
+        if self._last_decrease is not None and now - self._last_decrease < max(self.latency_ewma or 0, 1.0):
+            return
+        previous = self.limit
+        self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+        self._last_decrease = now
+        self.last_decrease_reason = reason
+        logger.warning(f"SMTP concurrency reduced {previous:.1f} -> {self.limit:.1f} ({reason})")
+
+    @contextmanager
+    def session(self) -> Iterator[None]:
+        """Hold a slot for one SMTP session, timing it and classifying any failure."""
+        self.acquire()
+        started = time.monotonic()
+        try:
+            yield
+        except BaseException as e:
+            self.release(time.monotonic() - started, smtp_error_code(e), failed=True)
+            raise
+        self.release(time.monotonic() - started)
+
+    def status(self) -> Dict[str, object]:
+        with self._condition:
+            now = time.monotonic()
+            recent = sum(1 for t in self._completions if now - t <= RATE_WINDOW_SECONDS)
+            return {
+                'limit': int(self.limit),
+                'limit_exact': round(self.limit, 2),
+                'min_limit': self.min_limit,
+                'max_limit': self.max_limit,
+                'in_flight': self.in_flight,
+                'latency_ewma_s': round(self.latency_ewma, 3) if self.latency_ewma is not None else None,
+                'latency_baseline_s': round(self.baseline, 3) if self.baseline is not None else None,
+                'latency_tolerance': self.latency_tolerance,
+                'latency_target_s': self.latency_target or None,
+                'send_rate_per_min': recent * 60 / RATE_WINDOW_SECONDS,
+                'sent': self.sent,
+                'throttled': self.throttled,
+                'errors': self.errors,
+                'last_decrease_reason': self.last_decrease_reason,
+            }
+
+
+smtp_controller = AIMDController()
@@ -0,0 +1,105 @@
+from datetime import datetime
+
+import pytest
+
+from backend.pacing import DeliveryPacer
+
+
+class FakeClock:
+    """Wall clock, monotonic clock and sleep that only move when the pacer sleeps."""
+
+    def __init__(self, now: datetime):
+        self.wall = now
+        self.elapsed = 0.0
+        self.sleeps = []
+
+    def now(self) -> datetime:
+        return self.wall
+
+    def monotonic(self) -> float:
+        return self.elapsed
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.elapsed += seconds
+
+
+def make_pacer(clock: FakeClock, *args, **kwargs) -> DeliveryPacer:
+    return DeliveryPacer(*args, now=clock.now, sleep=clock.sleep, monotonic=clock.monotonic, **kwargs)
+
+
+def test_same_day_window_before_start_waits_then_spreads():
+    clock = FakeClock(datetime(2026, 1, 5, 7, 0))
+    pacer = make_pacer(clock, '08:00', '10:00')
+    pacer.plan(120)
+    assert pacer.interval == pytest.approx(60.0)
+    pacer.wait_turn()
+    assert clock.sleeps == [pytest.approx(3600.0)]
+
+
+def test_same_day_window_in_progress_uses_remaining_time():
+    clock = FakeClock(datetime(2026, 1, 5, 9, 0))
+    pacer = make_pacer(clock, '08:00', '10:00')
+    pacer.plan(60)
+    assert pacer.interval == pytest.approx(60.0)
+    pacer.wait_turn()
+    assert clock.sleeps == []
+
+
+def test_closed_same_day_window_rolls_to_tomorrow():
+    clock = FakeClock(datetime(2026, 1, 5, 11, 0))
+    pacer = make_pacer(clock, '08:00', '10:00')
+    pacer.plan(100)
+    assert pacer.interval == pytest.approx(72.0)
+    pacer.wait_turn()
+    assert clock.sleeps == [pytest.approx(21 * 3600.0)]
+
+
+def test_overnight_window_after_midnight_stays_in_current_window():
+    clock = FakeClock(datetime(2026, 1, 5, 1, 0))
+    pacer = make_pacer(clock, '22:00', '02:00')
+    pacer.plan(60)
+    assert pacer.interval == pytest.approx(60.0)
+    pacer.wait_turn()
+    assert clock.sleeps == []
+
+
+def test_overnight_window_before_start_waits_for_tonight():
+    clock = FakeClock(datetime(2026, 1, 5, 3, 0))
+    pacer = make_pacer(clock, '22:00', '02:00')
+    pacer.plan(100)
+    assert pacer.interval == pytest.approx(144.0)
+    pacer.wait_turn()
+    assert clock.sleeps == [pytest.approx(19 * 3600.0)]
+
+
+def test_rate_cap_spaces_sends_without_window():
+    clock = FakeClock(datetime(2026, 1, 5, 12, 0))
+    pacer = make_pacer(clock, max_per_minute=30)
+    pacer.plan(3)
+    for _ in range(3):
+        pacer.wait_turn()
+    assert clock.sleeps == [pytest.approx(2.0), pytest.approx(2.0)]
+
+
+def test_rate_cap_wins_over_a_looser_window():
+    clock = FakeClock(datetime(2026, 1, 5, 8, 0))
+    pacer = make_pacer(clock, '08:00', '10:00', max_per_minute=10)
+    pacer.plan(7200)
+    assert pacer.interval == pytest.approx(6.0)
+
+
+@pytest.mark.parametrize('config', [
+    {'window_start': '08:00'},
+    {'window_end': '10:00'},
+    {'max_per_minute': 0},
+    {'max_per_minute': -5},
+])
+def test_invalid_config_is_rejected(config):
+    with pytest.raises(ValueError):
+        DeliveryPacer.from_config(config)
+
+
+def test_empty_config_means_no_pacing():
+    assert DeliveryPacer.from_config(None) is None
+    assert DeliveryPacer.from_config({'window_start': None, 'window_end': None, 'max_per_minute': None}) is None
@@ -0,0 +1,106 @@
+"""
+Full-file validation of training exports before any chart or email work starts.
+
+Every check is a whole-column operation, so all bad rows are found in one pass
+and the cost stays roughly linear even for 100k-row files.
+"""
+import logging
+from typing import Dict, List
+
+from .lazy_imports import pd
+from .ge_automatic_email_tracking import (
+    get_course_unit_2_indices,
+    extract_sso_ids,
+    METRIC_COLUMNS,
+    SUPERVISOR_COLUMN,
+)
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on the problems listed in an error message; the full list stays on the exception
+MAX_REPORTED_ERRORS = 20
+
+
+class CSVValidationError(ValueError):
+    """Raised when an export fails validation; `errors` holds one entry per problem."""
+
+    def __init__(self, errors: List[Dict[str, object]]):
+        self.errors = errors
+        super().__init__(summarise_errors(errors))
+
+
+def summarise_errors(errors: List[Dict[str, object]], limit: int = MAX_REPORTED_ERRORS) -> str:
+    lines = [
+        f"row {e['row']} (line {e['line']}): {e['message']}" if e.get('row') is not None else str(e['message'])
+        for e in errors[:limit]
+    ]
+    if len(errors) > limit:
+        lines.append(f"... and {len(errors) - limit} more")
+    return f"{len(errors)} problem(s) found: " + "; ".join(lines)
+
+
+def _row_errors(mask: 'pd.Series', values: 'pd.Series', column: str, message: str) -> List[Dict[str, object]]:
+    """One error entry per True in `mask`; `message` is formatted with the offending value."""
+    bad = values[mask]
+    return [
+        {
+            'row': int(index),
+            # Header is line 1 of the file and rows are 0-based
+            'line': int(index) + 2,
+            'column': column,
+            'value': None if pd.isna(value) else str(value),
+            'message': message.format(value=value),
+        }
+        for index, value in bad.items()
+    ]
+
+
+def find_invalid_rows(df: 'pd.DataFrame') -> List[Dict[str, object]]:
+    """Return every problem in the export, ordered by row; an empty list means the file is valid."""
+    if len(df) < 1:
+        return [{'row': None, 'message': "CSV file is empty"}]
+
+    required_columns = max(METRIC_COLUMNS.values()) + 1
+    if df.shape[1] < required_columns:
+        return [{'row': None, 'message': f"Expected at least {required_columns} columns, found {df.shape[1]}"}]
+
+    start_idx, end_idx = get_course_unit_2_indices(df)
+    if start_idx is None or end_idx is None:
+        return [{'row': None, 'message': "Could not find Course Units section in CSV"}]
+
+    section = df.iloc[start_idx:end_idx-3]
+    if section.empty:
+        return [{'row': None, 'message': "No supervisor rows found in Course Units section"}]
+
+    errors: List[Dict[str, object]] = []
+    numeric = {}
+    for name, position in METRIC_COLUMNS.items():
+        raw = section.iloc[:, position]
+        column = str(df.columns[position])
+        values = pd.to_numeric(raw, errors='coerce')
+        numeric[name] = values.fillna(0)
+        # Blank cells count as 0, anything else must parse as a number
+        errors += _row_errors(raw.notna() & values.isna(), raw, column, f"non-numeric {name} value '{{value}}'")
+        errors += _row_errors(values < 0, raw, column, f"negative {name} value {{value}}")
+
+    supervisors = section.iloc[:, SUPERVISOR_COLUMN].astype('string')
+    has_supervisor = supervisors.str.strip().fillna('') != ''
+    needs_email = (numeric['pending'] > 0) | (numeric['past_due'] > 0)
+    missing_sso = has_supervisor & needs_email & extract_sso_ids(supervisors).isna()
+    errors += _row_errors(
+        missing_sso.fillna(False).astype(bool),
+        supervisors,
+        str(df.columns[SUPERVISOR_COLUMN]),
+        "no SSO ID in brackets for supervisor '{value}' with pending tasks"
+    )
+
+    errors.sort(key=lambda e: e['row'])
+    return errors
+
+
+def validate_export(df: 'pd.DataFrame') -> None:
+    """Raise CSVValidationError listing every bad row, or return if the export is usable."""
+    errors = find_invalid_rows(df)
+    if errors:
+        logger.warning(f"Export failed validation with {len(errors)} problem(s)")
+        raise CSVValidationError(errors)
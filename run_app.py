@@ -2,6 +2,11 @@ import os
 import sys
 import subprocess
 import time
+import urllib.error
+import urllib.request
+
+BACKEND_READY_URL = os.getenv('BACKEND_READY_URL', 'http://127.0.0.1:8000/api/ready')
+BACKEND_READY_TIMEOUT = float(os.getenv('BACKEND_READY_TIMEOUT', '60'))
 
 class AutomaticEmailApp:
     def __init__(self):
@@ -14,12 +19,27 @@ class AutomaticEmailApp:
                 ['python', '-m', 'uvicorn', 'backend.api:app', '--host', '0.0.0.0', '--port', '8000'],
                 creationflags=subprocess.CREATE_NEW_CONSOLE
             )
-            time.sleep(5)
-            print("Backend server started successfully")
+            ready_after = self.wait_for_backend()
+            print(f"Backend server ready after {ready_after:.1f}s")
         except Exception as e:
             print(f"Error starting backend: {e}")
             sys.exit(1)
 
+    def wait_for_backend(self) -> float:
+        """Poll the backend readiness endpoint until it answers 200 instead of sleeping a fixed time."""
+        started = time.monotonic()
+        while time.monotonic() - started < BACKEND_READY_TIMEOUT:
+            if self.backend_process.poll() is not None:
+                raise RuntimeError(f"Backend exited with code {self.backend_process.returncode}")
+            try:
+                with urllib.request.urlopen(BACKEND_READY_URL, timeout=2) as response:
+                    if response.status == 200:
+                        return time.monotonic() - started
+            except (urllib.error.URLError, ConnectionError, TimeoutError):
+                pass
+            time.sleep(0.2)
+        raise TimeoutError(f"Backend not ready after {BACKEND_READY_TIMEOUT:.0f}s")
+
     def start_frontend(self):
         try:
             npm_path = 'C:\\Program Files\\nodejs\\npm.cmd'
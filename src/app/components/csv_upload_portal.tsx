@@ -4,7 +4,7 @@ import { Alert, AlertDescription } from "@/components/ui/alert";
 import { Button } from "@/components/ui/button";
 import { Upload, FileText, Loader2, Eye, Send } from "lucide-react";
 import { toast } from "@/hooks/use-toast";
-import EmailPreviewEditor from "./email_preview";
+import EmailPreviewEditor, { ChartData } from "./email_preview";
 import { sendTestEmail } from "../api/UploadService";
 
 interface UploadResponse {
@@ -19,7 +19,7 @@ interface UploadResponse {
 
 interface PreviewResponse {
   success: boolean;
-  chart: string;
+  chartUrl?: string | null;
   content: string;
   metrics: {
     total: number;
@@ -55,6 +55,7 @@ const API_CONFIG = {
   API_KEY: process.env.NEXT_PUBLIC_API_KEY as string,
   ENDPOINTS: {
     PREVIEW: "/api/preview-email",
+    CHART_DATA: "/api/chart-data",
     PROCESS: "/api/process-emails",
   },
 };
@@ -67,6 +68,7 @@ const CSVUpload = () => {
   const [recentFiles, setRecentFiles] = useState<FileItem[]>([]);
   const [currentStep, setCurrentStep] = useState<"upload" | "preview" | "complete">("upload");
   const [previewData, setPreviewData] = useState<PreviewResponse | null>(null);
+  const [chartData, setChartData] = useState<ChartData | null>(null);
   const [template, setTemplate] = useState<EmailTemplate>({
     subject: "Training Tasks Update",
     greeting: "Dear Team Leader,",
@@ -146,10 +148,19 @@ const CSVUpload = () => {
     const formData = new FormData();
     formData.append("file", file);
     formData.append("row_index", "0");
+    // The chart is drawn in the browser, so the server does not render a PNG for previews
+    formData.append("render_chart", "false");
+
+    const chartFormData = new FormData();
+    chartFormData.append("file", file);
 
     try {
-      const data = await makeAPIRequest(API_CONFIG.ENDPOINTS.PREVIEW, formData);
+      const [data, chart] = await Promise.all([
+        makeAPIRequest(API_CONFIG.ENDPOINTS.PREVIEW, formData),
+        makeAPIRequest(API_CONFIG.ENDPOINTS.CHART_DATA, chartFormData),
+      ]);
       setPreviewData(data);
+      setChartData(chart);
       setCurrentStep("preview");
       toast({
         title: "Preview Generated",
@@ -234,6 +245,7 @@ const CSVUpload = () => {
   const handleBackToUpload = () => {
     setCurrentStep("upload");
     setPreviewData(null);
+    setChartData(null);
     setError(null);
   };
 
@@ -354,7 +366,7 @@ const CSVUpload = () => {
                 setPreviewData(prev => prev ? {...prev, content} : null);
               }}
                 onProcess={handleProcess}
-                previewChart={previewData.chart}
+                chartData={chartData}
                 metrics={previewData.metrics}
               />
             </Card>
@@ -12,12 +12,59 @@ import {
 } from '@/components/ui/dialog';
 import { Eye, Send } from 'lucide-react';
 
+export interface ChartData {
+    supervisors: string[]; // In plotting order (top to bottom)
+    series: Record<string, number[]>; // Completed / Pending / Past Due, aligned with supervisors
+    max_total: number;
+    x_limits: number[];
+  }
+
+const CHART_CATEGORIES = ['Completed', 'Pending', 'Past Due'];
+const CHART_COLORS = ['#2ecc71', '#f1c40f', '#e74c3c'];
+
+const escapeHtml = (text: string) =>
+  text.replace(/&/g, '&amp;').replace(/</g, '&lt;').replace(/>/g, '&gt;').replace(/"/g, '&quot;');
+
+// Draws the same stacked bar chart as the email, in the browser, from /api/chart-data
+const buildChartSvg = (data: ChartData) => {
+  const labelWidth = 220;
+  const plotWidth = 540;
+  const rowHeight = 24;
+  const top = 40;
+  const height = top + data.supervisors.length * rowHeight + 10;
+  const maxX = data.x_limits[1] || 1;
+  const scale = (value: number) => (value / maxX) * plotWidth;
+
+  const legend = CHART_CATEGORIES.map((category, i) =>
+    `<rect x="${labelWidth + i * 120}" y="8" width="12" height="12" fill="${CHART_COLORS[i]}"/>` +
+    `<text x="${labelWidth + i * 120 + 18}" y="19" font-size="12">${category}</text>`
+  ).join('');
+
+  const rows = data.supervisors.map((supervisor, row) => {
+    const y = top + row * rowHeight;
+    let left = 0;
+    const bars = CHART_CATEGORIES.map((category, i) => {
+      const value = data.series[category]?.[row] || 0;
+      const bar = value > 0
+        ? `<rect x="${labelWidth + scale(left)}" y="${y + 4}" width="${scale(value)}" height="${rowHeight - 8}" fill="${CHART_COLORS[i]}"/>`
+        : '';
+      left += value;
+      return bar;
+    }).join('');
+    return `<text x="${labelWidth - 8}" y="${y + rowHeight / 2 + 4}" font-size="11" text-anchor="end">${escapeHtml(supervisor)}</text>` +
+      bars +
+      `<text x="${labelWidth + scale(left) + 4}" y="${y + rowHeight / 2 + 4}" font-size="11">${left}</text>`;
+  }).join('');
+
+  return `<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 ${labelWidth + plotWidth + 40} ${height}" style="max-width: 100%; height: auto; font-family: Arial, sans-serif;">${legend}${rows}</svg>`;
+};
+
 
 interface EmailPreviewEditorProps {
     emailContent: string;
     onContentChange: (content: string) => void;
     onProcess: (emailData: any) => Promise<void>;
-    previewChart: string;
+    chartData: ChartData | null; // Chart series, drawn client-side
     metrics: {
       total: number;
       completed: number;
@@ -39,7 +86,7 @@ const EmailPreviewEditor: React.FC<EmailPreviewEditorProps> = ({
   emailContent, 
   onContentChange, 
   onProcess,
-  previewChart,
+  chartData,
   metrics 
 }) => {
   const [isPreviewOpen, setIsPreviewOpen] = useState(false);
@@ -74,7 +121,7 @@ const EmailPreviewEditor: React.FC<EmailPreviewEditorProps> = ({
         </div>
         
         ${formatText(template.action)}
-        ${previewChart ? `<img src="data:image/png;base64,${previewChart}" style="max-width: 100%; height: auto;">` : ''}
+        ${chartData ? buildChartSvg(chartData) : ''}
         
         ${formatText(template.closing)}
       </body>
@@ -82,7 +129,7 @@ const EmailPreviewEditor: React.FC<EmailPreviewEditorProps> = ({
     `;
     setPreviewContent(updatedContent);
     onContentChange(updatedContent);
-  }, [template, metrics, previewChart]);
+  }, [template, metrics, chartData]);
 
   const handleTemplateChange = (field: keyof EmailTemplate, value: string) => {
     setTemplate(prev => ({ ...prev, [field]: value }));